@@ -0,0 +1,157 @@
+from datetime import date
+import numpy as np
+from fare_calculator import calculate_fare
+
+PERCENTILES = (50, 90, 95)
+
+# Window (days) of the trailing moving average of daily spend
+MOVING_AVERAGE_DAYS = 7
+
+# Days of moving average returned, counting back from today
+MOVING_AVERAGE_HISTORY = 30
+
+# 1970-01-01 was a Thursday; weeks are counted from Monday 1970-01-05
+_FIRST_MONDAY = 4
+
+def encode(values):
+    """Dictionary-encode a list of strings, returning (codes array, labels)"""
+    index = {}
+    codes = np.fromiter((index.setdefault(value, len(index)) for value in values),
+                        dtype=np.int64, count=len(values))
+    return codes, list(index)
+
+def to_arrays(columns):
+    """Turn the column lists from database.get_fare_columns() into NumPy arrays
+    
+    Strings become integer codes so grouping never has to sort text.
+    """
+    count = len(columns['total_fare'])
+    arrays = {
+        'seconds': np.fromiter(columns['created_seconds'], dtype=np.int64, count=count),
+        'total_fare': np.fromiter(columns['total_fare'], dtype=np.float64, count=count),
+        'district': np.fromiter(columns['district'], dtype=np.int64, count=count),
+    }
+    for column in ('start_location', 'destination', 'include_trike'):
+        arrays[column], arrays[column + '_labels'] = encode(columns[column])
+    return arrays
+
+def group_totals(keys, fares):
+    """Sum fares per distinct integer key, returning (keys, totals, counts)"""
+    unique_keys, codes = np.unique(keys, return_inverse=True)
+    totals = np.bincount(codes, weights=fares, minlength=len(unique_keys))
+    counts = np.bincount(codes, minlength=len(unique_keys))
+    return unique_keys, totals, counts
+
+def weekly_totals(days, fares):
+    """Total spend per Monday-based week, as [(week start date, total)]"""
+    weeks = (days - _FIRST_MONDAY) // 7
+    unique_weeks, totals, _ = group_totals(weeks, fares)
+    starts = (unique_weeks * 7 + _FIRST_MONDAY).astype('datetime64[D]')
+    return [(start.item(), float(total)) for start, total in zip(starts, totals)]
+
+def monthly_totals(days, fares):
+    """Total spend per calendar month, as [('YYYY-MM', total)]"""
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    unique_months, totals, _ = group_totals(months, fares)
+    labels = unique_months.astype('datetime64[M]')
+    return [(str(month), float(total)) for month, total in zip(labels, totals)]
+
+def route_totals(arrays):
+    """Spend per route, as [(route, total, trips)] from most to least spent"""
+    starts = arrays['start_location_labels']
+    destinations = arrays['destination_labels']
+    route_codes = arrays['start_location'] * len(destinations) + arrays['destination']
+    unique_routes, totals, counts = group_totals(route_codes, arrays['total_fare'])
+    
+    routes = []
+    for i in np.argsort(-totals, kind='stable'):
+        start, destination = divmod(int(unique_routes[i]), len(destinations))
+        routes.append((f"{starts[start]} - {destinations[destination]}", float(totals[i]), int(counts[i])))
+    return routes
+
+def transport_totals(arrays):
+    """Spend per transport type, splitting each trip by its route's segment fares
+    
+    Trips are grouped by distinct (district, route, trike) first, so the fare
+    guide is only consulted once per distinct trip rather than once per row.
+    """
+    starts = arrays['start_location_labels']
+    destinations = arrays['destination_labels']
+    trikes = arrays['include_trike_labels']
+    
+    # Pack the four columns into one integer key per row
+    trip_codes = arrays['district']
+    for column, labels in (('start_location', starts), ('destination', destinations),
+                           ('include_trike', trikes)):
+        trip_codes = trip_codes * len(labels) + arrays[column]
+    unique_trips, totals, _ = group_totals(trip_codes, arrays['total_fare'])
+    
+    spend = {}
+    for code, total in zip(unique_trips.tolist(), totals.tolist()):
+        code, trike = divmod(code, len(trikes))
+        code, destination = divmod(code, len(destinations))
+        district, start = divmod(code, len(starts))
+        guide_total, details = calculate_fare(starts[start], destinations[destination], trikes[trike], district)
+        if guide_total:
+            # Split what was actually paid in the same proportions as the guide
+            for detail in details:
+                share = total * detail.fare / guide_total
+                spend[detail.transport_type] = spend.get(detail.transport_type, 0.0) + share
+        else:
+            spend['unknown'] = spend.get('unknown', 0.0) + total
+    
+    return sorted(spend.items(), key=lambda item: -item[1])
+
+def day_number(day):
+    """Days since 1970-01-01, the same numbering as created_seconds // 86400"""
+    return (day - date(1970, 1, 1)).days
+
+def moving_average(days, fares, today, window=MOVING_AVERAGE_DAYS, history=MOVING_AVERAGE_HISTORY):
+    """Trailing average daily spend over `window` days, for the `history` days up to today
+    
+    Days without trips count as zero spend, up to and including today (a
+    day number), so the last value is always today's average.
+    """
+    first_day = days.min()
+    last_day = max(today, days.max())
+    daily = np.bincount(days - first_day, weights=fares, minlength=last_day - first_day + 1)
+    
+    # Running sums give every window's total in one subtraction
+    sums = np.concatenate(([0.0], np.cumsum(daily)))
+    ends = np.arange(1, len(daily) + 1)
+    averages = (sums[ends] - sums[np.maximum(ends - window, 0)]) / window
+    
+    dates = (np.arange(len(daily)) + first_day).astype('datetime64[D]')
+    return [(day.item(), float(average)) for day, average in zip(dates[-history:], averages[-history:])]
+
+def summarize(columns, today=None):
+    """Compute spending statistics for a fare history fetched as columns
+    
+    `today` (a date, default date.today()) is where the moving average ends
+    and which month 'this_month' reports, even if there were no trips lately.
+    """
+    today = today or date.today()
+    this_month = today.strftime('%Y-%m')
+    arrays = to_arrays(columns)
+    fares = arrays['total_fare']
+    if len(fares) == 0:
+        return {
+            'trips': 0, 'total': 0.0, 'average': 0.0,
+            'weekly': [], 'monthly': [], 'this_month': (this_month, 0.0), 'by_route': [], 'by_transport': [],
+            'moving_average': [], 'percentiles': {p: 0.0 for p in PERCENTILES}
+        }
+    
+    days = arrays['seconds'] // 86400
+    monthly = monthly_totals(days, fares)
+    return {
+        'trips': int(len(fares)),
+        'total': float(fares.sum()),
+        'average': float(fares.mean()),
+        'weekly': weekly_totals(days, fares),
+        'monthly': monthly,
+        'this_month': (this_month, dict(monthly).get(this_month, 0.0)),
+        'by_route': route_totals(arrays),
+        'by_transport': transport_totals(arrays),
+        'moving_average': moving_average(days, fares, day_number(today)),
+        'percentiles': dict(zip(PERCENTILES, (float(v) for v in np.percentile(fares, PERCENTILES))))
+    }
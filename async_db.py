@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+from database import POOL_CONFIG
+
+# How often the Tk loop checks whether a background query has finished
+POLL_INTERVAL_MS = 30
+
+# One worker per pooled connection so queries never wait on each other for a slot
+_executor = None
+
+def get_executor():
+    """Return the worker pool used for database calls, creating it on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=POOL_CONFIG['pool_size'],
+            thread_name_prefix='db-worker'
+        )
+    return _executor
+
+def submit(func, *args, **kwargs):
+    """Run func on a worker thread and return its Future"""
+    return get_executor().submit(func, *args, **kwargs)
+
+def run_async(widget, func, *args, on_success=None, on_error=None):
+    """Run func in the background and deliver the result on the Tk thread
+    
+    The future is polled with widget.after(), so callbacks always run inside
+    the mainloop and may touch widgets. Callbacks are dropped if the widget
+    was destroyed while the call was in flight.
+    """
+    future = submit(func, *args)
+    
+    def poll():
+        try:
+            if not widget.winfo_exists():
+                return
+        except Exception:
+            return  # Tk root already destroyed
+        
+        if not future.done():
+            widget.after(POLL_INTERVAL_MS, poll)
+            return
+        
+        error = future.exception()
+        if error is not None:
+            print(f"Background database call failed: {error}")
+            if on_error:
+                on_error(error)
+        elif on_success:
+            on_success(future.result())
+    
+    widget.after(POLL_INTERVAL_MS, poll)
+    return future
+
+def shutdown(wait=True):
+    """Stop the worker threads, waiting for queued calls by default"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=wait)
+        _executor = None
@@ -1,5 +1,4 @@
 from database import create_user, get_user
-from session import save_session
 
 def signup(srcode, name, password, college):
     """Handle user signup"""
@@ -12,10 +11,8 @@ def signup(srcode, name, password, college):
     if existing_user:
         return False, "SRCODE already exists"
     
-    # Create user
+    # Create user (the caller starts the session, which logs them in)
     if create_user(srcode, name, password, college):
-        # Auto-login: save session
-        save_session(srcode)
         return True, "Signup successful"
     else:
         return False, "Error creating user. Please check database connection."
@@ -35,7 +32,5 @@ def login(srcode, password):
     if user.get('password') != password:
         return False, None, "Invalid SRCODE or password"
     
-    # Save session
-    save_session(srcode)
     return True, user, "Login successful"
 
@@ -0,0 +1,361 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import database
+import fare_calculator
+import instrumentation
+from compile_fares import compile_fares
+from instrumentation import percentile
+
+# The harness runs in a scratch directory; this is where to ask git for the commit
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default sizes; every value can be overridden on the command line
+BENCH_CONFIG = {
+    'routes': [500],          # Routes per generated guide; give several to see how lookups scale
+    'districts': 6,
+    'stops': 60,              # Distinct locations per district
+    'segments': 3,            # Legs per route
+    'lookups': 5000,          # Random queries per fare benchmark
+    'users': 50,
+    'records_per_user': 200,
+    'db_calls': 200,          # Calls per database benchmark
+    'seed': 1
+}
+
+TRANSPORT_TYPES = ['jeepney', 'bus', 'van', 'tricycle']
+
+# Synthetic data
+
+def stop_name(district, number):
+    """Name of a generated location"""
+    return f"D{district} Stop {number}"
+
+def generate_fare_guide(routes, districts, stops, segments, rng):
+    """Return the text of a fare CSV with about `routes` routes spread over the districts
+    
+    Each route runs from one stop to another through `segments - 1` random
+    intermediate stops, in the same format as fare_data.csv.
+    """
+    lines = []
+    per_district = max(1, routes // districts)
+    for district in range(1, districts + 1):
+        lines.append(f"district {district}:")
+        lines.append("")
+        pairs = set()
+        # Every ordered pair of distinct stops is a possible route
+        limit = min(per_district, stops * (stops - 1))
+        while len(pairs) < limit:
+            start, destination = rng.sample(range(stops), 2)
+            pairs.add((start, destination))
+        
+        for start, destination in sorted(pairs):
+            path = [start] + rng.sample([s for s in range(stops) if s not in (start, destination)],
+                                        min(segments - 1, stops - 2)) + [destination]
+            lines.append(f"{stop_name(district, start)} - {stop_name(district, destination)}:")
+            lines.append("")
+            for a, b in zip(path, path[1:]):
+                fare = rng.randrange(20, 300) / 2
+                lines.append(f"{stop_name(district, a)} to {stop_name(district, b)},{rng.choice(TRANSPORT_TYPES)},{fare:.2f}")
+                lines.append("")
+    return "\n".join(lines)
+
+def generate_queries(guide, count, rng):
+    """Pick (district, start, destination) lookups: mostly listed routes, some reversed or chained"""
+    routes = [(district, route) for district, shard in guide.items() for route in shard]
+    queries = []
+    for _ in range(count):
+        district, route = rng.choice(routes)
+        start, destination = route.split(' - ')
+        kind = rng.random()
+        if kind < 0.2:
+            start, destination = destination, start
+        elif kind < 0.3:
+            # Another route's start, which usually needs the planner to chain segments
+            destination = rng.choice(routes)[1].split(' - ')[0]
+            if destination == start or not destination.startswith(f"d{district} "):
+                destination = route.split(' - ')[1]
+        queries.append((district, start, destination))
+    return queries
+
+def generate_history(users, records_per_user, districts, stops, rng):
+    """Return {srcode: [fare record tuples]} for synthetic users"""
+    history = {}
+    for number in range(users):
+        srcode = f"bench-{number:05d}"
+        records = []
+        for _ in range(records_per_user):
+            district = rng.randint(1, districts)
+            start, destination = rng.sample(range(stops), 2)
+            records.append((
+                srcode, str(district), stop_name(district, start).lower(), stop_name(district, destination).lower(),
+                rng.choice(['y', 'n']), rng.randrange(20, 600) / 2
+            ))
+        history[srcode] = records
+    return history
+
+# Measurement
+
+def measure(func, calls):
+    """Call func once per argument tuple in calls and summarize the per-call times (microseconds)"""
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for args in calls:
+            start = time.perf_counter()
+            func(*args)
+            timings.append(time.perf_counter() - start)
+    timings.sort()
+    total = sum(timings)
+    return {
+        'calls': len(timings),
+        'total_s': total,
+        'mean_us': total / len(timings) * 1e6 if timings else 0.0,
+        'min_us': timings[0] * 1e6 if timings else 0.0,
+        'p50_us': percentile(timings, 50) * 1e6,
+        'p95_us': percentile(timings, 95) * 1e6,
+        'p99_us': percentile(timings, 99) * 1e6,
+        'max_us': timings[-1] * 1e6 if timings else 0.0
+    }
+
+def report(name, result):
+    """Print one benchmark result line"""
+    print(f"  {name:<34} {result['calls']:>7}  p50 {result['p50_us']:>11.2f} us  "
+          f"p95 {result['p95_us']:>11.2f} us  p99 {result['p99_us']:>11.2f} us")
+
+def run_fare_benchmarks(routes, config, rng):
+    """Generate a guide with `routes` routes and time the fare lookups on it"""
+    text = generate_fare_guide(routes, config['districts'], config['stops'], config['segments'], rng)
+    with open(fare_calculator.CSV_FILE, 'w') as f:
+        f.write(text)
+    if os.path.exists('fare_data.bin'):
+        os.remove('fare_data.bin')
+    
+    results = {}
+    repeat = [()] * 5
+    results['load_fare_guide (csv)'] = measure(lambda: fare_calculator.load_fare_guide(force=True), repeat)
+    with contextlib.redirect_stdout(io.StringIO()):
+        compile_fares(fare_calculator.CSV_FILE, 'fare_data.bin')
+    results['load_fare_guide (snapshot)'] = measure(lambda: fare_calculator.load_fare_guide(force=True), repeat)
+    
+    guide = fare_calculator.fare_districts
+    queries = generate_queries(guide, config['lookups'], rng)
+    locations = [(start, district) for district, start, _ in queries]
+    # A quarter unknown names, which take the slow path
+    locations += [(f"nowhere {i}", district) for i, (_, district) in enumerate(locations[:len(locations) // 4])]
+    rng.shuffle(locations)
+    
+    results['find_record'] = measure(
+        lambda district, start, destination: fare_calculator.find_record(start, destination, district), queries)
+    results['calculate_fare'] = measure(
+        lambda district, start, destination: fare_calculator.calculate_fare(start, destination, 'y', district), queries)
+    # Same queries again; each one is now in the quote cache unless it was evicted
+    results['calculate_fare (repeat)'] = measure(
+        lambda district, start, destination: fare_calculator.calculate_fare(start, destination, 'y', district), queries)
+    results['is_valid_location'] = measure(fare_calculator.is_valid_location, locations)
+    results['suggest_locations'] = measure(
+        lambda location, district: fare_calculator.suggest_locations(location[:-1], district=district), locations)
+    
+    route_count = sum(len(shard) for shard in guide.values())
+    print(f"Fare guide: {route_count} routes, {len(text) // 1024} KiB")
+    for name, result in results.items():
+        report(name, result)
+    return {'routes': route_count, 'csv_bytes': len(text), 'results': results}
+
+def run_database_benchmarks(config, rng):
+    """Load synthetic histories into the configured database and time each database.py operation"""
+    if not database.initialize_database():
+        print(f"Could not set up the {database.DB_BACKEND} database; skipping the database benchmarks")
+        return None
+    history = generate_history(config['users'], config['records_per_user'], config['districts'], config['stops'], rng)
+    srcodes = list(history)
+    calls = config['db_calls']
+    picks = [(rng.choice(srcodes),) for _ in range(calls)]
+    results = {}
+    
+    results['create_user'] = measure(
+        lambda srcode: database.create_user(srcode, 'Bench User', 'password', 'College 1'), [(s,) for s in srcodes])
+    
+    batches = [(records,) for records in history.values()]
+    results['save_fare_records (per user)'] = measure(database.save_fare_records, batches)
+    singles = [(rng.choice(history[srcode]),) for srcode, in picks]
+    results['save_fare_record'] = measure(lambda record: database.save_fare_record(*record), singles)
+    
+    results['get_user (cached)'] = measure(database.get_user, picks)
+    results['get_user (uncached)'] = measure(
+        lambda srcode: (database.user_cache.invalidate(srcode), database.get_user(srcode)), picks)
+    results['update_college'] = measure(lambda srcode: database.update_college(srcode, 'College 2'), picks)
+    results['get_user_fares'] = measure(database.get_user_fares, picks)
+    results['get_user_fares_page (first)'] = measure(lambda srcode: database.get_user_fares_page(srcode, 50), picks)
+    
+    # Deep pages start after a record halfway through the user's history
+    middles = []
+    for srcode, in picks:
+        records = database.get_user_fares_page(srcode, config['records_per_user'] // 2)
+        last = records[-1] if records else None
+        middles.append((srcode, (last['created_date'], last['id']) if last else None))
+    results['get_user_fares_page (deep)'] = measure(
+        lambda srcode, after: database.get_user_fares_page(srcode, 50, after), middles)
+    
+    results['count_user_fares'] = measure(database.count_user_fares, picks)
+    results['get_fare_columns (user)'] = measure(lambda srcode: database.get_fare_columns(srcode=srcode), picks)
+    results['get_fare_columns (college)'] = measure(
+        lambda college: database.get_fare_columns(college=college), [('College 2',)] * 5)
+    results['get_weekly_totals'] = measure(database.get_weekly_totals, picks)
+    today = date.today()
+    results['get_fare_totals_between'] = measure(
+        lambda srcode: database.get_fare_totals_between(srcode, today - timedelta(days=30), today), picks)
+    results['rebuild_daily_totals (user)'] = measure(database.rebuild_daily_totals, picks[:20])
+    
+    deletes = []
+    for srcode, in picks[:50]:
+        records = database.get_user_fares_page(srcode, 1)
+        if records:
+            deletes.append((records[0]['id'],))
+    results['delete_fare_record'] = measure(database.delete_fare_record, deletes)
+    
+    total_records = sum(len(records) for records in history.values())
+    print(f"Database ({database.DB_BACKEND}): {len(srcodes)} users, {total_records} fare records")
+    for name, result in results.items():
+        report(name, result)
+    return {'backend': database.DB_BACKEND, 'users': len(srcodes), 'records': total_records, 'results': results}
+
+# Comparing runs
+
+def compare(old_path, new_results):
+    """Print how each benchmark's p50 changed against an earlier results file"""
+    with open(old_path, 'r') as f:
+        old = json.load(f)
+    print(f"Compared with {old_path} ({old['meta'].get('commit') or 'unknown commit'}):")
+    
+    def p50s(results):
+        values = {}
+        for run in results.get('fare_guide', []):
+            for name, result in run['results'].items():
+                values[f"{name} @ {run['routes']} routes"] = result['p50_us']
+        for name, result in (results.get('database') or {}).get('results', {}).items():
+            values[f"db {name}"] = result['p50_us']
+        return values
+    
+    before = p50s(old)
+    for name, after in p50s(new_results).items():
+        if name in before and before[name] > 0:
+            change = (after - before[name]) / before[name] * 100
+            flag = "  <-- slower" if change > 10 else ""
+            print(f"  {name:<52} {before[name]:>11.2f} -> {after:>11.2f} us  ({change:+.1f}%){flag}")
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def drop_mysql_database(db_config, name):
+    """Drop the benchmark database so each run loads the same data into empty tables"""
+    import mysql.connector
+    config = dict(db_config)
+    config.pop('database')
+    try:
+        connection = mysql.connector.connect(**config)
+        try:
+            cursor = connection.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{name}`")
+            cursor.close()
+        finally:
+            connection.close()
+        return True
+    except mysql.connector.Error as e:
+        print(f"Error resetting MySQL database '{name}': {e}")
+        return False
+
+def run_benchmarks(args, config, workdir):
+    """Run every benchmark the arguments ask for and return the results"""
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'config': config
+        },
+        'fare_guide': [],
+        'database': None
+    }
+    
+    for routes in args.routes:
+        rng = random.Random(args.seed)
+        results['fare_guide'].append(run_fare_benchmarks(routes, config, rng))
+    
+    if args.backend != 'none':
+        database.DB_BACKEND = args.backend
+        database.SQLITE_CONFIG['path'] = os.path.join(workdir, 'bench.db')
+        if args.backend == 'mysql':
+            # Start from an empty database every run; the migrations create it again
+            if not drop_mysql_database(database.DB_CONFIG, args.mysql_database):
+                print("Skipping the database benchmarks")
+                return results
+            database.DB_CONFIG['database'] = args.mysql_database
+        try:
+            results['database'] = run_database_benchmarks(config, random.Random(args.seed))
+        finally:
+            database.close_storage()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fare lookups, fare guide loading and database operations on synthetic data")
+    parser.add_argument('--routes', type=int, nargs='+', default=BENCH_CONFIG['routes'], help="routes per generated fare guide (several sizes allowed)")
+    parser.add_argument('--districts', type=int, default=BENCH_CONFIG['districts'], help="districts in the generated guide")
+    parser.add_argument('--stops', type=int, default=BENCH_CONFIG['stops'], help="locations per district")
+    parser.add_argument('--segments', type=int, default=BENCH_CONFIG['segments'], help="legs per route")
+    parser.add_argument('--lookups', type=int, default=BENCH_CONFIG['lookups'], help="queries per fare benchmark")
+    parser.add_argument('--users', type=int, default=BENCH_CONFIG['users'], help="synthetic users")
+    parser.add_argument('--records-per-user', type=int, default=BENCH_CONFIG['records_per_user'], help="fare records per user")
+    parser.add_argument('--db-calls', type=int, default=BENCH_CONFIG['db_calls'], help="calls per database benchmark")
+    parser.add_argument('--seed', type=int, default=BENCH_CONFIG['seed'], help="random seed, so runs are reproducible")
+    parser.add_argument('--backend', choices=['sqlite', 'mysql', 'none'], default='sqlite',
+                        help="database to benchmark: a fresh SQLite file, a local MySQL server, or none")
+    parser.add_argument('--mysql-database', default='faretracker_bench',
+                        help="MySQL database to use; it is dropped and recreated on every run, so it must not be the app's own")
+    parser.add_argument('--no-metrics', action='store_true', help="turn off the instrumentation timers while benchmarking")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="JSON file to write the results to")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args()
+    
+    if args.backend == 'mysql' and args.mysql_database == database.DB_CONFIG['database']:
+        parser.error(f"--mysql-database must not be the app's own database '{args.mysql_database}'; the benchmark drops it")
+    
+    config = dict(vars(args))
+    if args.no_metrics:
+        instrumentation.INSTRUMENTATION_CONFIG['enabled'] = False
+    output = os.path.abspath(args.output)
+    previous = os.path.abspath(args.compare) if args.compare else None
+    
+    # Generated files and the SQLite database go in a scratch directory, away from the real ones
+    workdir = tempfile.mkdtemp(prefix='faretracker-bench-')
+    os.chdir(workdir)
+    try:
+        results = run_benchmarks(args, config, workdir)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved results to {output}")
+    
+    if previous:
+        compare(previous, results)
+
+if __name__ == "__main__":
+    main()
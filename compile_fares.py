@@ -0,0 +1,43 @@
+import argparse
+import hashlib
+import os
+import sys
+from fare_calculator import CSV_FILE, parse_fare_guide, validate_fare_data
+from fare_snapshot import SNAPSHOT_FILE, write_snapshot
+
+def compile_fares(csv_file, output_file):
+    """Validate the fare CSV and write a binary snapshot of it"""
+    if not os.path.exists(csv_file):
+        print(f"Error: {csv_file} not found")
+        return False
+    
+    with open(csv_file, 'rb') as f:
+        data = f.read()
+    text = data.decode('utf-8')
+    
+    errors = validate_fare_data(text)
+    if errors:
+        print(f"{csv_file} has {len(errors)} problem(s):")
+        for error in errors:
+            print(f"  {error}")
+        return False
+    
+    shards = parse_fare_guide(text)
+    write_snapshot(shards, hashlib.sha1(data).hexdigest(), len(data), output_file)
+    
+    route_count = sum(len(guide) for guide in shards.values())
+    segment_count = sum(len(segments) for guide in shards.values() for segments in guide.values())
+    print(f"Compiled {route_count} routes ({segment_count} segments) in {len(shards)} districts into {output_file}")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile fare_data.csv into a binary fare snapshot")
+    parser.add_argument('csv_file', nargs='?', default=CSV_FILE, help="fare data CSV to compile")
+    parser.add_argument('-o', '--output', default=SNAPSHOT_FILE, help="snapshot file to write")
+    args = parser.parse_args()
+    
+    if not compile_fares(args.csv_file, args.output):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
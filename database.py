@@ -1,8 +1,13 @@
-import mysql.connector
-from mysql.connector import Error
-from datetime import datetime
+import os
+import threading
+from lru_cache import LRUCache
+from instrumentation import timed, count, register_gauges
 
-# Database configuration
+# Storage backend: 'mysql' for a MySQL server, 'sqlite' for an embedded
+# database file. The FARETRACKER_BACKEND environment variable overrides it.
+DB_BACKEND = os.environ.get('FARETRACKER_BACKEND', 'mysql')
+
+# Database configuration (mysql backend)
 DB_CONFIG = {
     'host': 'localhost',
     'port': 3306,
@@ -11,174 +16,269 @@ DB_CONFIG = {
     'database': 'faretracker_db'
 }
 
-def get_connection():
-    """Create and return MySQL database connection"""
-    try:
-        connection = mysql.connector.connect(**DB_CONFIG)
-        return connection
-    except Error as e:
-        print(f"Error connecting to MySQL: {e}")
-        print(f"Please ensure MySQL is running and database '{DB_CONFIG['database']}' exists")
-        return None
-    except Exception as e:
-        print(f"Unexpected error connecting to database: {e}")
-        return None
+# Connection pool configuration (mysql backend)
+POOL_CONFIG = {
+    'pool_size': 5,           # Maximum number of open connections
+    'acquire_timeout': 10,    # Seconds to wait for a free connection
+    'ping_after': 30          # Ping idle connections older than this (seconds)
+}
+
+# Database file configuration (sqlite backend)
+SQLITE_CONFIG = {
+    'path': 'faretracker.db',
+    'busy_timeout': 10        # Seconds to wait for another writer to finish
+}
+
+# Cache of user rows by srcode, so repeat dashboard visits and logins skip the database
+USER_CACHE_CONFIG = {
+    'max_size': 256,          # Most user rows kept
+    'ttl': 300                # Re-read a cached row after this long (seconds)
+}
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def create_storage(backend):
+    """Build the storage backend named by `backend`"""
+    # Drivers are imported here so only the selected one has to be installed
+    if backend == 'mysql':
+        from storage_mysql import MySQLStorage
+        return MySQLStorage(DB_CONFIG, POOL_CONFIG)
+    if backend == 'sqlite':
+        from storage_sqlite import SQLiteStorage
+        return SQLiteStorage(**SQLITE_CONFIG)
+    raise ValueError(f"Unknown storage backend '{backend}' (expected 'mysql' or 'sqlite')")
+
+def get_storage():
+    """Return the process-wide storage backend, creating it on first use"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage(DB_BACKEND)
+        return _storage
+
+def close_storage():
+    """Close all database connections (call on shutdown)"""
+    global _storage
+    with _storage_lock:
+        storage, _storage = _storage, None
+    if storage:
+        storage.close()
+    user_cache.clear()
+
+def log_error(action, error):
+    """Report a failed database call and count it"""
+    count('db.errors')
+    print(f"Error {action}: {error}")
 
+@timed('db.initialize_database')
 def initialize_database():
-    """Database and tables must be created manually"""
-    # No automatic creation - users must create database and tables manually
-    pass
+    """Create the database schema or upgrade it to the latest version"""
+    return get_storage().initialize()
 
 # CRUD Operations for Users
 
+user_cache = LRUCache(**USER_CACHE_CONFIG)
+
+def user_cache_stats():
+    """Return the user cache's hit/miss counters and size"""
+    return user_cache.stats()
+
+register_gauges('user_cache', user_cache_stats)
+
+@timed('db.create_user')
 def create_user(srcode, name, password, college):
     """Insert a new user into the database"""
-    connection = get_connection()
-    if not connection:
-        return False
-    
+    storage = get_storage()
     try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            INSERT INTO users (srcode, name, password, college)
-            VALUES (%s, %s, %s, %s)
-        """, (srcode, name, password, college))
-        connection.commit()
-        cursor.close()
-        connection.close()
+        storage.create_user(srcode, name, password, college)
+        user_cache.put(srcode, {'srcode': srcode, 'name': name, 'password': password, 'college': college})
         return True
-    except Error as e:
-        print(f"Error creating user: {e}")
-        if connection:
-            connection.close()
+    except storage.Error as e:
+        log_error("creating user", e)
         return False
 
+@timed('db.get_user')
 def get_user(srcode):
-    """Get user by SRCODE"""
-    connection = get_connection()
-    if not connection:
-        return None
+    """Get user by SRCODE, from the cache when it has a fresh copy"""
+    user = user_cache.get(srcode)
+    if user is not None:
+        return dict(user)
     
+    storage = get_storage()
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("SELECT * FROM users WHERE srcode = %s", (srcode,))
-        user = cursor.fetchone()
-        cursor.close()
-        connection.close()
+        user = storage.get_user(srcode)
+        # Unknown srcodes are not cached, so a later signup is seen right away
+        if user is not None:
+            user_cache.put(srcode, dict(user))
         return user
-    except Error as e:
-        print(f"Error getting user: {e}")
-        if connection:
-            connection.close()
+    except storage.Error as e:
+        log_error("getting user", e)
         return None
 
+@timed('db.update_college')
 def update_college(srcode, new_college):
     """Update user's college"""
-    connection = get_connection()
-    if not connection:
-        return False
-    
+    storage = get_storage()
     try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            UPDATE users SET college = %s WHERE srcode = %s
-        """, (new_college, srcode))
-        connection.commit()
-        cursor.close()
-        connection.close()
+        storage.update_college(srcode, new_college)
+        user = user_cache.peek(srcode)
+        if user is not None:
+            user_cache.put(srcode, dict(user, college=new_college))
         return True
-    except Error as e:
-        print(f"Error updating college: {e}")
-        if connection:
-            connection.close()
+    except storage.Error as e:
+        # The row may or may not have changed; read it again next time
+        user_cache.invalidate(srcode)
+        log_error("updating college", e)
         return False
 
 # CRUD Operations for Fare History
 
 def save_fare_record(srcode, district, start_location, destination, include_trike, total_fare):
     """Save a fare calculation record"""
-    connection = get_connection()
-    if not connection:
-        return False
-    
-    try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            INSERT INTO fare_history (srcode, district, start_location, destination, include_trike, total_fare)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """, (srcode, district, start_location, destination, include_trike, total_fare))
-        connection.commit()
-        cursor.close()
-        connection.close()
-        return True
-    except Error as e:
-        print(f"Error saving fare record: {e}")
-        if connection:
-            connection.close()
-        return False
+    return save_fare_records([(srcode, district, start_location, destination, include_trike, total_fare)]) == 1
 
+@timed('db.get_user_fares')
 def get_user_fares(srcode):
     """Get all fare records for a user"""
-    connection = get_connection()
-    if not connection:
+    storage = get_storage()
+    try:
+        return storage.get_user_fares(srcode)
+    except storage.Error as e:
+        log_error("getting user fares", e)
         return []
+
+@timed('db.save_fare_records')
+def save_fare_records(records, keys=None, created=None):
+    """Save many fare records in one transaction, returning how many were inserted
     
+    Each record is a (srcode, district, start_location, destination,
+    include_trike, total_fare) tuple. They are inserted with executemany(),
+    and the users' daily totals are updated in the same transaction.
+    `keys` optionally gives each record an idempotency key; records whose
+    key is already stored are skipped, so a batch can safely be resent.
+    `created` optionally gives each record the time it was taken (see
+    storage.TIMESTAMP_FORMAT); by default records are stamped now.
+    """
+    records = [tuple(record) for record in records]
+    if not records:
+        return 0
+    
+    storage = get_storage()
     try:
-        cursor = connection.cursor(dictionary=True)
-        cursor.execute("""
-            SELECT * FROM fare_history 
-            WHERE srcode = %s 
-            ORDER BY created_date DESC
-        """, (srcode,))
-        fares = cursor.fetchall()
-        cursor.close()
-        connection.close()
-        return fares
-    except Error as e:
-        print(f"Error getting user fares: {e}")
-        if connection:
-            connection.close()
+        return storage.save_fare_records(records, keys, created)
+    except storage.Error as e:
+        log_error("saving fare records", e)
+        return 0
+
+@timed('db.get_user_fares_page')
+def get_user_fares_page(srcode, limit, after=None):
+    """Get one page of a user's fare records, newest first
+    
+    `after` is the (created_date, id) of the last record on the previous page.
+    Pages are located by key instead of OFFSET so deep pages stay cheap.
+    """
+    storage = get_storage()
+    try:
+        return storage.get_user_fares_page(srcode, limit, after)
+    except storage.Error as e:
+        log_error("getting user fares", e)
         return []
 
+@timed('db.count_user_fares')
+def count_user_fares(srcode):
+    """Count a user's fare records"""
+    storage = get_storage()
+    try:
+        return storage.count_user_fares(srcode)
+    except storage.Error as e:
+        log_error("counting user fares", e)
+        return 0
+
+@timed('db.delete_fare_record')
 def delete_fare_record(record_id):
     """Delete a fare record by ID"""
-    connection = get_connection()
-    if not connection:
-        return False
-    
+    storage = get_storage()
     try:
-        cursor = connection.cursor()
-        cursor.execute("DELETE FROM fare_history WHERE id = %s", (record_id,))
-        connection.commit()
-        cursor.close()
-        connection.close()
+        storage.delete_fare_record(record_id)
         return True
-    except Error as e:
-        print(f"Error deleting fare record: {e}")
-        if connection:
-            connection.close()
+    except storage.Error as e:
+        log_error("deleting fare record", e)
         return False
 
-def get_weekly_average(srcode):
-    """Calculate average fare for the last 7 days"""
-    connection = get_connection()
-    if not connection:
-        return 0.0
+@timed('db.get_fare_columns')
+def get_fare_columns(srcode=None, college=None):
+    """Fetch fare history for one user or a whole college as columns
+    
+    Returns a dict of column name -> list, in created_date order, so
+    analytics can turn each column into an array in one step. Dates come
+    back as wall-clock seconds since 1970-01-01 and fares as floats, which
+    are much cheaper to convert than datetime and Decimal objects.
+    """
+    columns = ['created_seconds', 'total_fare', 'district', 'start_location', 'destination', 'include_trike']
+    result = {column: [] for column in columns}
+    if not srcode and not college:
+        return result
     
+    storage = get_storage()
     try:
-        cursor = connection.cursor()
-        cursor.execute("""
-            SELECT AVG(total_fare) as avg_fare
-            FROM fare_history
-            WHERE srcode = %s AND created_date >= DATE_SUB(NOW(), INTERVAL 7 DAY)
-        """, (srcode,))
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        return float(result[0]) if result[0] else 0.0
-    except Error as e:
-        print(f"Error calculating weekly average: {e}")
-        if connection:
-            connection.close()
-        return 0.0
+        rows = storage.get_fare_rows(srcode, college)
+        if rows:
+            for column, values in zip(columns, zip(*rows)):
+                result[column] = list(values)
+        return result
+    except storage.Error as e:
+        log_error("getting fare history columns", e)
+        return result
+
+# Fare aggregates, served from the per-user daily rollups in fare_daily_totals
 
+@timed('db.get_fare_totals')
+def get_fare_totals(srcode, days):
+    """Get the sum and count of fares over the last `days` calendar days (today included)"""
+    storage = get_storage()
+    try:
+        total, count = storage.get_fare_totals(srcode, days)
+        return float(total), int(count)
+    except storage.Error as e:
+        log_error("calculating fare totals", e)
+        return 0.0, 0
+
+@timed('db.get_fare_totals_between')
+def get_fare_totals_between(srcode, start_day, end_day):
+    """Get the sum and count of fares from start_day to end_day (dates, inclusive)"""
+    storage = get_storage()
+    try:
+        total, count = storage.get_fare_totals_between(srcode, start_day, end_day)
+        return float(total), int(count)
+    except storage.Error as e:
+        log_error("calculating fare totals", e)
+        return 0.0, 0
+
+def get_average_fare(srcode, days):
+    """Calculate average fare over the last `days` calendar days"""
+    total, count = get_fare_totals(srcode, days)
+    return total / count if count else 0.0
+
+def get_weekly_totals(srcode):
+    """Get the sum and count of fares for the last 7 days"""
+    return get_fare_totals(srcode, 7)
+
+def get_weekly_average(srcode):
+    """Calculate average fare for the last 7 days"""
+    return get_average_fare(srcode, 7)
+
+def get_monthly_average(srcode):
+    """Calculate average fare for the last 30 days"""
+    return get_average_fare(srcode, 30)
+
+@timed('db.rebuild_daily_totals')
+def rebuild_daily_totals(srcode=None):
+    """Recompute the daily rollups from raw fare history (all users, or one)"""
+    storage = get_storage()
+    try:
+        storage.rebuild_daily_totals(srcode)
+        return True
+    except storage.Error as e:
+        log_error("rebuilding daily totals", e)
+        return False
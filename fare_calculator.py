@@ -1,82 +1,335 @@
-import csv
+import hashlib
 import os
+import threading
+from fare_route import Route, make_leg
+from fare_snapshot import load_snapshot
+from lru_cache import LRUCache
+from instrumentation import timed, register_gauges
+from route_planner import RoutePlanner
+from location_index import LocationIndex
+
+CSV_FILE = "fare_data.csv"
+
+# Most recent fare quotes kept, keyed by normalized trip and fare guide version
+QUOTE_CACHE_SIZE = 1024
 
 # Global variable to store fare guide data
 fare_guide = {}
 
-def load_fare_guide():
-    """Load fare data from CSV file"""
-    global fare_guide
-    fare_guide = {}
+# The same routes split by the "district N:" header they are listed under
+fare_districts = {}
+
+# District number each route is listed under
+route_districts = {}
+
+# Bumped every time a new fare guide is swapped in
+fare_guide_version = 0
+
+# (mtime, size, sha1) of the CSV the current fare guide was built from
+_fare_signature = None
+_fare_lock = threading.Lock()
+
+# Districts loaded so far when loading lazily, or None once every district is loaded
+_loaded_districts = None
+
+# Lookup structures derived from the fare guide: (name, district) -> (version, object)
+_derived = {}
+
+# (version, district, start, destination, trike) -> (total, legs) or (None, error message)
+_quote_cache = LRUCache(QUOTE_CACHE_SIZE)
+
+def parse_district_header(line):
+    """Return the number from a "district N:" line, or None if it has none"""
+    number = line.rstrip(':')[len('district'):].strip()
+    return int(number) if number.isdigit() else None
+
+def parse_fare_guide(text, districts=None):
+    """Parse fare data text into {district: {route: Route}}
     
-    csv_file = "fare_data.csv"
-    if not os.path.exists(csv_file):
-        print(f"Warning: {csv_file} not found")
+    Routes listed before any district header go under district 0. When
+    `districts` is given, only those districts are built.
+    """
+    shards = {}
+    guide = None
+    current_route = None
+    current_district = 0
+    
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        
+        # Check if this is a district line (e.g., "district 1:")
+        if line.lower().startswith('district'):
+            current_district = parse_district_header(line) or 0
+            current_route = None
+            guide = None
+            continue
+        
+        # Skip districts that were not asked for
+        if districts is not None and current_district not in districts:
+            continue
+        if guide is None:
+            guide = shards.setdefault(current_district, {})
+        
+        # Check if this is a route header (contains " - " and ends with ":")
+        # Format: "Balayan - BSU:" or "BSU - Balayan:"
+        if " - " in line and line.endswith(':'):
+            # Remove colon and convert to lowercase for matching
+            current_route = line.rstrip(':').strip().lower()
+            guide[current_route] = []
+        elif current_route:
+            # This is a segment line: "segment,transport_type,fare"
+            # Format: "Balayan to Grand Terminal,bus,106.00"
+            parts = line.split(',')
+            if len(parts) >= 3:
+                segment = parts[0].strip()
+                transport_type = parts[1].strip()
+                try:
+                    fare = float(parts[2].strip())
+                    guide[current_route].append(make_leg(segment, transport_type, fare))
+                except ValueError:
+                    continue  # Skip invalid fare values
+    
+    # Freeze each route's legs and precompute its totals
+    return {district: {route: Route(legs) for route, legs in guide.items()}
+            for district, guide in shards.items()}
+
+def validate_fare_data(text):
+    """Check fare data text for malformed lines, returning a list of error messages"""
+    errors = []
+    seen_routes = set()
+    current_route = None
+    current_route_line = 0
+    segment_count = 0
+    
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        
+        if line.lower().startswith('district'):
+            if current_route and segment_count == 0:
+                errors.append(f"line {current_route_line}: route '{current_route}' has no segments")
+            current_route = None
+            if not line.endswith(':') or parse_district_header(line) is None:
+                errors.append(f"line {line_number}: bad district header '{line}'")
+            continue
+        
+        if " - " in line and line.endswith(':'):
+            if current_route and segment_count == 0:
+                errors.append(f"line {current_route_line}: route '{current_route}' has no segments")
+            current_route = line.rstrip(':').strip().lower()
+            current_route_line = line_number
+            segment_count = 0
+            if current_route in seen_routes:
+                errors.append(f"line {line_number}: duplicate route '{current_route}'")
+            seen_routes.add(current_route)
+            continue
+        
+        if not current_route:
+            errors.append(f"line {line_number}: segment outside of a route '{line}'")
+            continue
+        
+        parts = line.split(',')
+        if len(parts) != 3:
+            errors.append(f"line {line_number}: expected 'segment,transport_type,fare' but got '{line}'")
+            continue
+        try:
+            fare = float(parts[2].strip())
+        except ValueError:
+            errors.append(f"line {line_number}: invalid fare '{parts[2].strip()}'")
+            continue
+        if fare < 0:
+            errors.append(f"line {line_number}: negative fare '{parts[2].strip()}'")
+            continue
+        segment_count += 1
+    
+    if current_route and segment_count == 0:
+        errors.append(f"line {current_route_line}: route '{current_route}' has no segments")
+    
+    return errors
+
+def _install_shards(shards, loaded_districts):
+    """Swap in a new set of district shards along with the merged route lookups"""
+    global fare_guide, fare_districts, route_districts, fare_guide_version, _loaded_districts
+    
+    # Build everything off to the side, then swap it in at once
+    # so readers never see a half-built dictionary
+    new_guide = {}
+    new_route_districts = {}
+    for district, routes in sorted(shards.items()):
+        new_guide.update(routes)
+        for route in routes:
+            new_route_districts[route] = district
+    
+    fare_districts = shards
+    route_districts = new_route_districts
+    fare_guide = new_guide
+    _loaded_districts = loaded_districts
+    fare_guide_version += 1
+    _quote_cache.clear()
+    return len(new_guide)
+
+@timed('fares.load_fare_guide')
+def load_fare_guide(force=False, district=None):
+    """Load fare data from CSV file, reparsing only when the file has changed
+    
+    With `district`, only that district is parsed (if it is not loaded yet);
+    otherwise the whole guide is loaded. A changed file with problems is
+    reported and the current guide stays in place.
+    """
+    errors = _load_fare_guide(force, district)
+    if errors:
+        print(f"{CSV_FILE} has {len(errors)} problem(s); keeping fare guide version {fare_guide_version}:")
+        for error in errors[:10]:
+            print(f"  {error}")
         return False
+    return True
+
+@timed('fares.reload_fare_guide')
+def reload_fare_guide():
+    """Validate the changed CSV and load it, returning a list of problems (empty on success)
+    
+    The current guide stays in place if the new file has problems.
+    """
+    return _load_fare_guide()
+
+def _load_fare_guide(force=False, district=None):
+    """Load the fare guide if the CSV has changed, returning a list of problems (empty on success)
+    
+    The CSV is read once and the same text is validated, parsed and
+    published, so an edit made in the meantime waits for the next load.
+    """
+    global _fare_signature
+    
+    csv_file = CSV_FILE
+    if not os.path.exists(csv_file):
+        return [f"{csv_file} not found"]
     
     try:
-        current_route = None
-        current_district = None
-        
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
+        with _fare_lock:
+            stat = os.stat(csv_file)
+            
+            def already_loaded():
+                if _loaded_districts is None:
+                    return True
+                return district is not None and district in _loaded_districts
+            
+            # Cheap check first: same mtime and size means nothing to do
+            if (not force and _fare_signature and already_loaded()
+                    and _fare_signature[:2] == (stat.st_mtime_ns, stat.st_size)):
+                return []
+            
+            with open(csv_file, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                data = f.read()
+            digest = hashlib.sha1(data).hexdigest()
+            
+            # File was touched but the content is the same
+            same_content = not force and _fare_signature and _fare_signature[2] == digest
+            if same_content and already_loaded():
+                _fare_signature = (stat.st_mtime_ns, stat.st_size, digest)
+                return []
+            
+            # Prefer the compiled snapshot when it was built from exactly this CSV
+            new_shards = load_snapshot(digest, len(data))
+            snapshot = new_shards is not None
+            if snapshot:
+                # The snapshot always holds every district
+                loaded_districts = None
+            else:
+                try:
+                    text = data.decode('utf-8')
+                except UnicodeDecodeError as e:
+                    return [str(e)]
+                errors = validate_fare_data(text)
+                if errors:
+                    return errors
                 
-                # Check if this is a district line (e.g., "district 1:")
-                if line.lower().startswith('district'):
-                    # Extract district number if needed
-                    current_district = line
-                    continue
-                
-                # Check if this is a route header (contains " - " and ends with ":")
-                # Format: "Balayan - BSU:" or "BSU - Balayan:"
-                if " - " in line and line.endswith(':'):
-                    # Remove colon and convert to lowercase for matching
-                    current_route = line.rstrip(':').strip().lower()
-                    fare_guide[current_route] = []
-                elif current_route:
-                    # This is a segment line: "segment,transport_type,fare"
-                    # Format: "Balayan to Grand Terminal,bus,106.00"
-                    parts = line.split(',')
-                    if len(parts) >= 3:
-                        segment = parts[0].strip()
-                        transport_type = parts[1].strip()
-                        try:
-                            fare = float(parts[2].strip())
-                            fare_guide[current_route].append({
-                                'segment': segment,
-                                'transport_type': transport_type,
-                                'fare': fare
-                            })
-                        except ValueError:
-                            continue  # Skip invalid fare values
-                    elif len(parts) == 1 and " - " in line:
-                        # This might be a new route header without colon, reset current_route
-                        # But in the provided format, all route headers have colons
-                        pass
+                if district is None:
+                    new_shards = parse_fare_guide(text)
+                    loaded_districts = None
+                else:
+                    new_shards = parse_fare_guide(text, {district})
+                    new_shards.setdefault(district, {})
+                    loaded_districts = {district}
+                    if same_content:
+                        # Add this district to the ones already loaded
+                        merged = dict(fare_districts)
+                        merged.update(new_shards)
+                        new_shards = merged
+                        loaded_districts |= _loaded_districts
+            
+            route_count = _install_shards(new_shards, loaded_districts)
+            _fare_signature = (stat.st_mtime_ns, stat.st_size, digest)
         
-        print(f"Loaded {len(fare_guide)} routes from CSV")
-        return True
+        print(f"Loaded {route_count} routes from {'snapshot' if snapshot else 'CSV'}")
+        return []
     except Exception as e:
-        print(f"Error loading fare guide: {e}")
         import traceback
         traceback.print_exc()
-        return False
+        return [f"could not load {csv_file}: {e}"]
+
+def routes_for_district(district=None):
+    """Return the routes to search: one district's shard, or the whole guide"""
+    if district is None:
+        return fare_guide
+    return fare_districts.get(district, {})
+
+@timed('fares.is_valid_location')
+def is_valid_location(location, district=None):
+    """Check if location exists in fare guide (or in one district of it)"""
+    return get_location_index(district).contains(location)
+
+@timed('fares.suggest_locations')
+def suggest_locations(prefix, limit=10, district=None):
+    """Return known locations starting with prefix (for autocomplete)"""
+    if not prefix.strip():
+        return []
+    return get_location_index(district).complete(prefix, limit)
+
+def did_you_mean(location, district=None):
+    """Return the closest known location to a misspelled one, or None"""
+    suggestions = get_location_index(district).suggest(location, limit=1)
+    return suggestions[0] if suggestions else None
+
+def unknown_location_message(location, district=None):
+    """Build an error message for a location that is not in the fare guide"""
+    where = f" in district {district}" if district is not None else ""
+    if district is not None:
+        for other in sorted(fare_districts):
+            if other != district and get_location_index(other).contains(location):
+                return f"Unknown location '{location}'{where} (it is listed under district {other})"
+    
+    suggestion = did_you_mean(location, district)
+    if suggestion:
+        return f"Unknown location '{location}'{where}. Did you mean '{suggestion}'?"
+    return f"Unknown location '{location}'{where}"
+
+def _derive(name, district, builder):
+    """Build (once per fare guide version) a structure derived from some routes"""
+    version = fare_guide_version
+    key = (name, district)
+    cached = _derived.get(key)
+    if cached is None or cached[0] != version:
+        cached = (version, builder(routes_for_district(district)))
+        _derived[key] = cached
+    return cached[1]
+
+def get_route_planner(district=None):
+    """Return a route planner for the current fare guide, rebuilding it after a reload"""
+    return _derive('planner', district, RoutePlanner)
+
+def get_location_index(district=None):
+    """Return the location index for the current fare guide"""
+    return _derive('locations', district, LocationIndex)
 
-def is_valid_location(location):
-    """Check if location exists in fare guide"""
-    location_lower = location.lower()
-    for route in fare_guide.keys():
-        # Check if location is part of any route
-        if location_lower in route:
-            return True
-    return False
-
-def find_record(start_location, destination):
-    """Find route record matching start and destination"""
-    if not fare_guide:
+@timed('fares.find_record')
+def find_record(start_location, destination, district=None):
+    """Find the Route matching start and destination"""
+    guide = routes_for_district(district)  # Snapshot in case a reload swaps the guide
+    if not guide:
         return None
     
     start_lower = start_location.lower().strip()
@@ -84,46 +337,63 @@ def find_record(start_location, destination):
     
     # Try direct route: "start - destination"
     route_key1 = f"{start_lower} - {dest_lower}"
-    if route_key1 in fare_guide:
-        return fare_guide[route_key1]
+    if route_key1 in guide:
+        return guide[route_key1]
     
     # Try reverse route: "destination - start"
     route_key2 = f"{dest_lower} - {start_lower}"
-    if route_key2 in fare_guide:
-        return fare_guide[route_key2]
+    if route_key2 in guide:
+        return guide[route_key2]
     
-    return None
+    # No hand-written route, so chain segments together instead
+    return get_route_planner(district).cheapest_route(start_lower, dest_lower)
 
-def calculate_fare(start_location, destination, include_trike):
-    """Calculate total fare for a route"""
-    segments = find_record(start_location, destination)
-    
-    if not segments:
-        return None, "Route not found"
+def route_not_found_message(start_location, destination, district=None):
+    """Build an error message for a missing route, pointing at the right district"""
+    if district is not None:
+        start_lower = start_location.lower().strip()
+        dest_lower = destination.lower().strip()
+        for route_key in (f"{start_lower} - {dest_lower}", f"{dest_lower} - {start_lower}"):
+            other = route_districts.get(route_key)
+            if other is not None and other != district:
+                return f"Route not found in district {district} (it is listed under district {other})"
+    return "Route not found"
+
+def quote_cache_stats():
+    """Return the fare quote cache's hit/miss counters and size"""
+    return _quote_cache.stats()
+
+register_gauges('quote_cache', quote_cache_stats)
+
+@timed('fares.calculate_fare')
+def calculate_fare(start_location, destination, include_trike, district=None):
+    """Calculate total fare for a route
     
-    total = 0.0
-    route_details = []
+    Returns (total, legs) where legs is a tuple of FareLeg, or (None, error
+    message). Quotes are cached until the fare guide is reloaded.
+    """
+    start_lower = start_location.lower().strip()
+    dest_lower = destination.lower().strip()
+    trike = bool(include_trike) and include_trike.lower().strip() == 'y'
+    key = (fare_guide_version, district, start_lower, dest_lower, trike)
     
-    for segment in segments:
-        fare = segment['fare']
-        total += fare
-        route_details.append({
-            'segment': segment['segment'],
-            'transport_type': segment['transport_type'],
-            'fare': fare
-        })
+    quote = _quote_cache.get(key)
+    if quote is None:
+        quote = _quote(start_lower, dest_lower, trike, district)
+        _quote_cache.put(key, quote)
+    return quote
+
+def _quote(start_location, destination, trike, district):
+    """Work out a fare quote from the fare guide"""
+    route = find_record(start_location, destination, district)
     
-    # Add trike fee if applicable
-    if include_trike and include_trike.lower().strip() == 'y':
-        total += 20.00
-        route_details.append({
-            'segment': 'Trike fee',
-            'transport_type': 'trike',
-            'fare': 20.00
-        })
+    if not route:
+        return None, route_not_found_message(start_location, destination, district)
     
-    return total, route_details
+    # Totals are precomputed, so this is just picking one
+    return route.quote(trike)
 
+@timed('fares.data_entry')
 def data_entry(district, start_location, destination, include_trike):
     """Main function to process fare calculation input"""
     # Validate inputs are not empty
@@ -151,11 +421,26 @@ def data_entry(district, start_location, destination, include_trike):
     if include_trike not in ['y', 'n']:
         return None, None, "Include trike must be 'y' or 'n'"
     
+    # Check both locations exist in the district before looking for a route
+    if routes_for_district(district_num):
+        for location in (start_location, destination):
+            if not is_valid_location(location, district_num):
+                return None, None, unknown_location_message(location, district_num)
+    
     # Calculate fare
-    total_fare, route_details = calculate_fare(start_location, destination, include_trike)
+    total_fare, route_details = calculate_fare(start_location, destination, include_trike, district_num)
     
     if total_fare is None:
         return None, None, route_details  # route_details contains error message
     
     return total_fare, route_details, None
 
+
+def price_trips(trips):
+    """Price trips lazily, one result per (district, start, destination, trike) row
+    
+    Yields (total_fare, route_details, error) tuples in the same order as the
+    input, so arbitrarily large trip files can be streamed through.
+    """
+    for district, start_location, destination, include_trike in trips:
+        yield data_entry(district, start_location, destination, include_trike)
@@ -0,0 +1,305 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from database import get_storage, log_error
+from storage import TIMESTAMP_FORMAT
+from instrumentation import count, timed
+
+# Append-only journal of fare saves and deletes not yet written to the database
+JOURNAL_FILE = "fare_journal.jsonl"
+
+# Entries the database refused (or that could not be read), kept for a person to look at
+REJECTED_FILE = "fare_journal.rejected.jsonl"
+
+# Background sync of the journal to the database
+SYNC_CONFIG = {
+    'batch_size': 50,         # Sync as soon as this many entries are journaled
+    'flush_interval': 2.0,    # Otherwise sync this often (seconds)
+    'retry_initial': 1.0,     # First wait after a failed sync (seconds)
+    'retry_max': 60.0         # Longest wait between retries (seconds)
+}
+
+class FareJournal:
+    """Durable list of pending fare operations, stored one JSON entry per line
+    
+    Entries are appended and fsynced before append() returns. Once entries
+    reach the database they are dropped by rewriting the (short) remainder.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.appended = 0    # Entries appended by this process, so pages can tell data changed
+        self._entries, torn = self._read()
+        if torn:
+            # Start clean so new entries do not land on the end of a torn line
+            self._write(self._entries)
+        self._file = open(self.path, 'a', encoding='utf-8')
+    
+    def _read(self):
+        """Load entries left over from an earlier run, and whether any line was unreadable"""
+        entries = []
+        torn = False
+        if not os.path.exists(self.path):
+            return entries, torn
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # A crash mid-append can leave a torn last line
+                    print(f"Skipping unreadable journal entry: {line.strip()[:80]}")
+                    torn = True
+        return entries, torn
+    
+    def _write(self, entries):
+        """Atomically replace the journal file with these entries"""
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def append(self, entry):
+        """Write one entry to disk and return once it is durable"""
+        line = json.dumps(entry, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._entries.append(entry)
+            self.appended += 1
+    
+    def peek(self, limit):
+        """Return up to `limit` of the oldest pending entries"""
+        with self._lock:
+            return self._entries[:limit]
+    
+    def pending_count(self):
+        """Return how many entries are waiting to be synced"""
+        with self._lock:
+            return len(self._entries)
+    
+    def remove(self, count):
+        """Drop the oldest `count` entries once they are in the database"""
+        with self._lock:
+            remaining = self._entries[count:]
+            self._file.close()
+            self._write(remaining)
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._entries = remaining
+    
+    def close(self):
+        """Close the journal file"""
+        with self._lock:
+            self._file.close()
+
+def entry_problem(entry):
+    """Return why a journal entry can never be applied, or None if it looks well formed"""
+    if not isinstance(entry, dict):
+        return "entry is not an object"
+    if entry.get('op') == 'delete':
+        return None if entry.get('id') is not None else "delete without a record id"
+    if entry.get('op') == 'save':
+        record = entry.get('record')
+        if not isinstance(record, list) or len(record) != 6:
+            return "save without a 6-field record"
+        if not entry.get('key'):
+            return "save without an idempotency key"
+        # Entries journaled before timestamps were recorded have none and are stamped at sync time
+        created = entry.get('created')
+        if created is not None:
+            try:
+                datetime.strptime(created, TIMESTAMP_FORMAT)
+            except (TypeError, ValueError):
+                return f"save with an unreadable timestamp {created!r}"
+        return None
+    return f"unknown op {entry.get('op')!r}"
+
+def reject_entry(entry, reason, path=REJECTED_FILE):
+    """Move an entry that can never be applied to the rejected file, so it stops blocking the journal"""
+    print(f"Rejected journaled fare change ({reason}); kept in {path}")
+    count('journal.rejected')
+    try:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'entry': entry, 'reason': reason, 'rejected_at': time.time()}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Error saving rejected journal entry: {e}")
+
+@timed('journal.replay')
+def replay(entries, reject=reject_entry):
+    """Apply journal entries to the database in order, returning how many were dealt with
+    
+    Runs of saves go in one batch; their idempotency keys make a batch safe
+    to resend after a failure that happened after the commit. Saves are
+    dated by when they were journaled, not when they reach the database.
+    Entries that are malformed or that the database refuses (integrity or
+    data errors) are handed to reject() and count as dealt with, so one
+    bad entry cannot hold up the rest. Replay stops at the first transient error (database
+    unreachable, lock timeout), leaving that entry and later ones pending.
+    """
+    storage = get_storage()
+    index = 0
+    while index < len(entries):
+        entry = entries[index]
+        problem = entry_problem(entry)
+        if problem:
+            reject(entry, problem)
+            index += 1
+            continue
+        
+        if entry['op'] == 'delete':
+            try:
+                storage.delete_fare_record(entry['id'])
+            except storage.PermanentError as e:
+                reject(entry, str(e))
+            except storage.Error as e:
+                log_error("replaying fare delete", e)
+                return index
+            index += 1
+            continue
+        
+        run = []
+        while (index + len(run) < len(entries) and not entry_problem(entries[index + len(run)])
+               and entries[index + len(run)]['op'] == 'save'):
+            run.append(entries[index + len(run)])
+        try:
+            storage.save_fare_records([tuple(entry['record']) for entry in run], [entry['key'] for entry in run],
+                                      [entry.get('created') for entry in run])
+        except storage.PermanentError:
+            # Something in the batch was refused; save one at a time to find it
+            for offset, entry in enumerate(run):
+                try:
+                    storage.save_fare_records([tuple(entry['record'])], [entry['key']], [entry.get('created')])
+                except storage.PermanentError as e:
+                    reject(entry, str(e))
+                except storage.Error as e:
+                    log_error("replaying fare records", e)
+                    return index + offset
+        except storage.Error as e:
+            log_error("replaying fare records", e)
+            return index
+        index += len(run)
+    return index
+
+class JournalSync:
+    """Replays the journal to the database on a background thread, backing off while it is unreachable"""
+    
+    def __init__(self, journal, batch_size, flush_interval, retry_initial, retry_max):
+        self.journal = journal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self._condition = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='fare-sync', daemon=True)
+        self._thread.start()
+    
+    def notify(self):
+        """Wake the worker if a full batch is waiting"""
+        if self.journal.pending_count() >= self.batch_size:
+            with self._condition:
+                self._condition.notify()
+    
+    def sync(self):
+        """Replay everything journaled so far; stops at the first transient failure"""
+        with self._sync_lock:
+            while True:
+                batch = self.journal.peek(self.batch_size)
+                if not batch:
+                    return True
+                done = replay(batch)
+                if done:
+                    self.journal.remove(done)
+                if done < len(batch):
+                    return False
+    
+    def _run(self):
+        """Sync on the size threshold or every flush_interval, with exponential backoff after failures"""
+        delay = self.flush_interval
+        while True:
+            with self._condition:
+                self._condition.wait_for(
+                    lambda: self._stopping or self.journal.pending_count() >= self.batch_size,
+                    timeout=delay
+                )
+                if self._stopping:
+                    return
+            if self.sync():
+                delay = self.flush_interval
+            else:
+                delay = min(self.retry_max, max(self.retry_initial, delay * 2))
+    
+    def stop(self):
+        """Stop the worker and try one last sync; anything left stays journaled for next time"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        synced = self.sync()
+        if not synced:
+            print(f"{self.journal.pending_count()} fare change(s) kept in {self.journal.path} until the database is reachable")
+        self.journal.close()
+        return synced
+
+_sync = None
+_sync_lock = threading.Lock()
+
+def get_sync():
+    """Return the process-wide journal sync worker, starting it on first use"""
+    global _sync
+    with _sync_lock:
+        if _sync is None:
+            _sync = JournalSync(FareJournal(JOURNAL_FILE), **SYNC_CONFIG)
+        return _sync
+
+def queue_fare_record(srcode, district, start_location, destination, include_trike, total_fare):
+    """Journal a fare record and return once it is on disk; it reaches the database in the background"""
+    sync = get_sync()
+    try:
+        sync.journal.append({
+            'op': 'save',
+            'key': uuid.uuid4().hex,
+            'created': datetime.now().strftime(TIMESTAMP_FORMAT),
+            'record': [srcode, district, start_location, destination, include_trike, float(total_fare)]
+        })
+    except OSError as e:
+        print(f"Error journaling fare record: {e}")
+        return False
+    sync.notify()
+    return True
+
+def queue_fare_delete(record_id):
+    """Journal a delete to replay once the database is reachable"""
+    sync = get_sync()
+    try:
+        sync.journal.append({'op': 'delete', 'id': record_id})
+    except OSError as e:
+        print(f"Error journaling fare delete: {e}")
+        return False
+    sync.notify()
+    return True
+
+def change_count():
+    """Return how many fare changes this process has journaled (cheap staleness check)"""
+    return get_sync().journal.appended
+
+def flush_fare_queue():
+    """Sync journaled changes now (e.g. before reading a user's history)"""
+    return get_sync().sync()
+
+def stop_write_queue():
+    """Stop the sync worker after a final sync (call on shutdown)"""
+    global _sync
+    with _sync_lock:
+        sync, _sync = _sync, None
+    return sync.stop() if sync else True
@@ -0,0 +1,34 @@
+import sys
+from collections import namedtuple
+
+TRIKE_FEE = 20.00
+
+# One leg of a route; plain tuples carry no per-instance dict
+FareLeg = namedtuple('FareLeg', ['segment', 'transport_type', 'fare'])
+TRIKE_LEG = FareLeg('Trike fee', 'trike', TRIKE_FEE)
+
+def make_leg(segment, transport_type, fare):
+    """Build a leg with interned strings, so each stop name and transport type is stored once"""
+    return FareLeg(sys.intern(segment), sys.intern(transport_type), fare)
+
+class Route:
+    """A route's legs, with its total precomputed with and without the trike fee"""
+    
+    __slots__ = ('legs', 'total', 'total_with_trike')
+    
+    def __init__(self, legs):
+        self.legs = tuple(legs)
+        self.total = sum(leg.fare for leg in self.legs)
+        self.total_with_trike = self.total + TRIKE_FEE
+    
+    def __iter__(self):
+        return iter(self.legs)
+    
+    def __len__(self):
+        return len(self.legs)
+    
+    def quote(self, trike):
+        """Return (total, legs) for this route, adding the trike fee if asked"""
+        if trike:
+            return self.total_with_trike, self.legs + (TRIKE_LEG,)
+        return self.total, self.legs
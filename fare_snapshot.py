@@ -0,0 +1,131 @@
+import os
+import struct
+import sys
+from array import array
+from fare_route import FareLeg, Route
+
+SNAPSHOT_FILE = "fare_data.bin"
+
+# Bump whenever the layout below changes; older snapshots are then ignored
+MAGIC = b'FGSN'
+FORMAT_VERSION = 2
+
+# magic, format version, byte order, csv size, csv sha1
+HEADER = struct.Struct('<4sHcQ20s')
+COUNT = struct.Struct('<I')
+
+def _byteorder_flag():
+    """Return the native byte order marker stored in the header"""
+    return b'<' if sys.byteorder == 'little' else b'>'
+
+def write_snapshot(shards, digest, csv_size, path=SNAPSHOT_FILE):
+    """Write a fare guide ({district: {route: Route}}) to a compact binary snapshot file"""
+    strings = []
+    string_ids = {}
+    
+    def intern_id(value):
+        # Every distinct string is stored once and referenced by index
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+    
+    route_keys = array('I')
+    route_district_ids = array('H')
+    route_offsets = array('I', [0])
+    segment_names = array('I')
+    segment_types = array('I')
+    segment_fares = array('d')
+    
+    for district, guide in shards.items():
+        for route, segments in guide.items():
+            route_keys.append(intern_id(route))
+            route_district_ids.append(district)
+            for segment in segments:
+                segment_names.append(intern_id(segment.segment))
+                segment_types.append(intern_id(segment.transport_type))
+                segment_fares.append(segment.fare)
+            route_offsets.append(len(segment_fares))
+    
+    encoded = [s.encode('utf-8') for s in strings]
+    string_lengths = array('I', [len(s) for s in encoded])
+    
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, _byteorder_flag(),
+                            csv_size, bytes.fromhex(digest)))
+        f.write(COUNT.pack(len(strings)))
+        f.write(string_lengths.tobytes())
+        f.write(b''.join(encoded))
+        f.write(COUNT.pack(len(route_keys)))
+        f.write(route_keys.tobytes())
+        f.write(route_district_ids.tobytes())
+        f.write(route_offsets.tobytes())
+        f.write(COUNT.pack(len(segment_fares)))
+        f.write(segment_names.tobytes())
+        f.write(segment_types.tobytes())
+        f.write(segment_fares.tobytes())
+    
+    # Replace the old snapshot in one step so readers never see a partial file
+    os.replace(tmp_path, path)
+    return True
+
+def _read_array(data, offset, typecode, count):
+    """Read `count` items of `typecode` from data starting at offset"""
+    values = array(typecode)
+    end = offset + values.itemsize * count
+    values.frombytes(data[offset:end])
+    return values, end
+
+def load_snapshot(csv_digest, csv_size, path=SNAPSHOT_FILE):
+    """Load a snapshot if it was compiled from the CSV with this sha1 and size, returning shards or None
+    
+    Only the digest is trusted: mtimes survive copies and checkouts, and
+    a fare edit can leave the size unchanged.
+    """
+    try:
+        if not os.path.exists(path):
+            return None
+        
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        magic, version, byteorder, size, digest = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        if byteorder != _byteorder_flag() or size != csv_size or digest.hex() != csv_digest:
+            return None
+        offset = HEADER.size
+        
+        (string_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        string_lengths, offset = _read_array(data, offset, 'I', string_count)
+        strings = []
+        for length in string_lengths:
+            strings.append(sys.intern(data[offset:offset + length].decode('utf-8')))
+            offset += length
+        
+        (route_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        route_keys, offset = _read_array(data, offset, 'I', route_count)
+        route_district_ids, offset = _read_array(data, offset, 'H', route_count)
+        route_offsets, offset = _read_array(data, offset, 'I', route_count + 1)
+        
+        (segment_count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+        segment_names, offset = _read_array(data, offset, 'I', segment_count)
+        segment_types, offset = _read_array(data, offset, 'I', segment_count)
+        segment_fares, offset = _read_array(data, offset, 'd', segment_count)
+        
+        shards = {}
+        for i, key_id in enumerate(route_keys):
+            guide = shards.setdefault(route_district_ids[i], {})
+            guide[strings[key_id]] = Route(
+                FareLeg(strings[segment_names[j]], strings[segment_types[j]], segment_fares[j])
+                for j in range(route_offsets[i], route_offsets[i + 1])
+            )
+        
+        return shards
+    except Exception as e:
+        print(f"Ignoring unreadable fare snapshot: {e}")
+        return None
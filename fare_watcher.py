@@ -0,0 +1,137 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import fare_calculator
+from fare_calculator import reload_fare_guide
+
+# How the watcher notices edits to the fare CSV
+WATCH_CONFIG = {
+    'poll_interval': 1.0,     # Seconds between checks when inotify is unavailable
+    'debounce': 0.3           # Wait this long after a change for the editor to finish writing
+}
+
+# inotify event flags (see inotify(7)): file written, renamed into place, or created
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+EVENT_HEADER = struct.Struct('iIII')
+
+def open_inotify(directory):
+    """Watch a directory with inotify, returning the file descriptor or None if unsupported"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK)
+        if fd < 0:
+            return None
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def read_event_names(fd):
+    """Drain pending inotify events, returning the file names they refer to"""
+    names = set()
+    while True:
+        try:
+            data = os.read(fd, 4096)
+        except BlockingIOError:
+            return names
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            names.add(os.fsdecode(data[offset:offset + length].rstrip(b'\0')))
+            offset += length
+
+def file_signature(path):
+    """Return (mtime_ns, size) of a file, or None if it does not exist"""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+class FareGuideWatcher:
+    """Reloads the fare guide on a background thread whenever the CSV changes"""
+    
+    def __init__(self, path, poll_interval, debounce):
+        self.path = os.path.abspath(path)
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.mode = None
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='fare-watcher', daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        fd = open_inotify(os.path.dirname(self.path))
+        self.mode = 'inotify' if fd is not None else 'polling'
+        try:
+            if fd is not None:
+                self._watch_inotify(fd)
+            else:
+                self._watch_polling()
+        finally:
+            if fd is not None:
+                os.close(fd)
+    
+    def _watch_inotify(self, fd):
+        """Wait for inotify events naming the CSV"""
+        name = os.path.basename(self.path)
+        while not self._stopping.is_set():
+            ready, _, _ = select.select([fd], [], [], self.poll_interval)
+            if ready and name in read_event_names(fd):
+                # Editors often write in several steps; let them finish
+                if self._stopping.wait(self.debounce):
+                    return
+                read_event_names(fd)
+                self.reload()
+    
+    def _watch_polling(self):
+        """Compare the CSV's mtime and size every poll_interval"""
+        last = file_signature(self.path)
+        while not self._stopping.wait(self.poll_interval):
+            current = file_signature(self.path)
+            if current != last:
+                if self._stopping.wait(self.debounce):
+                    return
+                last = file_signature(self.path)
+                self.reload()
+    
+    def reload(self):
+        """Validate and load the changed CSV, keeping the current guide if it is invalid"""
+        errors = reload_fare_guide()
+        if errors:
+            print(f"{self.path} has {len(errors)} problem(s); keeping fare guide version {fare_calculator.fare_guide_version}:")
+            for error in errors[:10]:
+                print(f"  {error}")
+    
+    def stop(self):
+        """Stop watching"""
+        self._stopping.set()
+        self._thread.join()
+
+_watcher = None
+
+def start_fare_watcher():
+    """Start watching the fare CSV (once per process)"""
+    global _watcher
+    if _watcher is None:
+        _watcher = FareGuideWatcher(fare_calculator.CSV_FILE, **WATCH_CONFIG)
+    return _watcher
+
+def stop_fare_watcher():
+    """Stop the fare CSV watcher (call on shutdown)"""
+    global _watcher
+    watcher, _watcher = _watcher, None
+    if watcher:
+        watcher.stop()
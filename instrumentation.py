@@ -0,0 +1,277 @@
+import io
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# Latency and call counts for the database and fare calculator entry points.
+# Set FARETRACKER_METRICS=0 to turn the timers off entirely.
+INSTRUMENTATION_CONFIG = {
+    'enabled': os.environ.get('FARETRACKER_METRICS', '1') != '0',
+    'sample_window': 2048,    # Latest timings kept per call for the percentiles
+    'profile_top': 30         # Functions listed in the cProfile report
+}
+
+PERCENTILES = (50, 95, 99)
+
+class Histogram:
+    """Timings of one call: totals since reset plus a window of recent samples for percentiles"""
+    
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, seconds, failed=False):
+        """Add one timing"""
+        with self._lock:
+            self.samples.append(seconds)
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+            if failed:
+                self.errors += 1
+    
+    def clear(self):
+        """Drop every timing"""
+        with self._lock:
+            self.samples.clear()
+            self.count = 0
+            self.errors = 0
+            self.total = 0.0
+            self.max = 0.0
+    
+    def snapshot(self):
+        """Return count, errors, total, mean, max and p50/p95/p99, in seconds"""
+        with self._lock:
+            samples = sorted(self.samples)
+            result = {
+                'count': self.count,
+                'errors': self.errors,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'max': self.max
+            }
+        for p in PERCENTILES:
+            result[f'p{p}'] = percentile(samples, p)
+        return result
+
+def percentile(sorted_samples, p):
+    """Nearest-rank percentile of an already sorted list (0.0 if empty)"""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, -(-len(sorted_samples) * p // 100))
+    return sorted_samples[int(rank) - 1]
+
+_lock = threading.Lock()
+_histograms = {}    # call name -> Histogram
+_counters = {}      # event name -> count
+_gauges = {}        # group name -> function returning {name: number}
+
+def get_histogram(name):
+    """Return the histogram for a call name, creating it on first use"""
+    histogram = _histograms.get(name)
+    if histogram is None:
+        with _lock:
+            histogram = _histograms.setdefault(name, Histogram(INSTRUMENTATION_CONFIG['sample_window']))
+    return histogram
+
+def count(name, amount=1):
+    """Add to an event counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def register_gauges(group, stats_function):
+    """Export the numbers returned by stats_function() (e.g. cache hit/miss counts) under group"""
+    with _lock:
+        _gauges[group] = stats_function
+
+# Optional cProfile capture of the instrumented calls
+
+_profiling = False
+_profile_stats = None
+_profile_local = threading.local()
+
+def start_profiling():
+    """Profile instrumented calls until stop_profiling(), discarding any earlier capture"""
+    global _profiling, _profile_stats
+    with _lock:
+        _profile_stats = None
+        _profiling = True
+
+def stop_profiling():
+    """Stop profiling and return the report"""
+    global _profiling
+    _profiling = False
+    return profile_report()
+
+def is_profiling():
+    """Return True while a cProfile capture is running"""
+    return _profiling
+
+def profile_report(sort='cumulative'):
+    """Return the captured profile as text, top functions first"""
+    with _lock:
+        if _profile_stats is None:
+            return "No profile captured."
+        out = io.StringIO()
+        _profile_stats.stream = out
+        _profile_stats.sort_stats(sort).print_stats(INSTRUMENTATION_CONFIG['profile_top'])
+        return out.getvalue()
+
+def _run_profiled(func, args, kwargs):
+    """Run the outermost instrumented call on this thread under cProfile"""
+    global _profile_stats
+    if getattr(_profile_local, 'active', False):
+        return func(*args, **kwargs)
+    
+    # Imported only when profiling, to keep them off the startup path
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler per process; skip this call
+        return func(*args, **kwargs)
+    
+    _profile_local.active = True
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        _profile_local.active = False
+        with _lock:
+            if _profile_stats is None:
+                _profile_stats = pstats.Stats(profiler)
+            else:
+                _profile_stats.add(profiler)
+
+# Timers
+
+@contextmanager
+def timer(name):
+    """Time a block under name, counting it as an error if it raises"""
+    if not INSTRUMENTATION_CONFIG['enabled']:
+        yield
+        return
+    histogram = get_histogram(name)
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        histogram.record(time.perf_counter() - start, failed)
+
+def timed(name):
+    """Decorator that times every call of a function under name"""
+    def decorator(func):
+        histogram = get_histogram(name)
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not INSTRUMENTATION_CONFIG['enabled']:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            failed = False
+            try:
+                if _profiling:
+                    return _run_profiled(func, args, kwargs)
+                return func(*args, **kwargs)
+            except BaseException:
+                failed = True
+                raise
+            finally:
+                histogram.record(time.perf_counter() - start, failed)
+        return wrapper
+    return decorator
+
+# Reporting and export
+
+def snapshot():
+    """Return every timing, counter and gauge as plain dicts"""
+    with _lock:
+        histograms = dict(_histograms)
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+    
+    gauge_values = {}
+    for group, stats_function in gauges.items():
+        try:
+            gauge_values[group] = dict(stats_function())
+        except Exception as e:
+            print(f"Error reading {group} stats: {e}")
+    
+    return {
+        'timings': {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+        'counters': dict(sorted(counters.items())),
+        'gauges': gauge_values
+    }
+
+def reset():
+    """Clear all timings and counters (gauges come from their owners and are not reset)"""
+    with _lock:
+        histograms = list(_histograms.values())
+        _counters.clear()
+    # Decorated functions hold on to their histogram, so clear them in place
+    for histogram in histograms:
+        histogram.clear()
+
+def export_json(path=None):
+    """Return the snapshot as JSON text, also writing it to path if given"""
+    text = json.dumps(dict(snapshot(), generated_at=time.time()), indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    return text
+
+def prometheus_name(name):
+    """Turn a name like 'user_cache' or 'db.errors' into a valid Prometheus name part"""
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+def prometheus_text(path=None):
+    """Return the snapshot in the Prometheus text exposition format, also writing it to path if given"""
+    data = snapshot()
+    lines = [
+        "# HELP faretracker_call_seconds Latency of instrumented calls",
+        "# TYPE faretracker_call_seconds summary"
+    ]
+    for name, stats in data['timings'].items():
+        for p in PERCENTILES:
+            # Prometheus expects NaN for quantiles with no observations
+            value = f'{stats[f"p{p}"]:.9f}' if stats['count'] else 'NaN'
+            lines.append(f'faretracker_call_seconds{{call="{name}",quantile="{p / 100}"}} {value}')
+        lines.append(f'faretracker_call_seconds_sum{{call="{name}"}} {stats["total"]:.9f}')
+        lines.append(f'faretracker_call_seconds_count{{call="{name}"}} {stats["count"]}')
+    
+    lines.append("# HELP faretracker_call_errors_total Instrumented calls that raised")
+    lines.append("# TYPE faretracker_call_errors_total counter")
+    for name, stats in data['timings'].items():
+        lines.append(f'faretracker_call_errors_total{{call="{name}"}} {stats["errors"]}')
+    
+    lines.append("# HELP faretracker_events_total Counted events")
+    lines.append("# TYPE faretracker_events_total counter")
+    for name, value in data['counters'].items():
+        lines.append(f'faretracker_events_total{{event="{name}"}} {value}')
+    
+    for group, values in data['gauges'].items():
+        for key, value in values.items():
+            metric = f"faretracker_{prometheus_name(group)}_{prometheus_name(key)}"
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+    
+    text = "\n".join(lines) + "\n"
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    return text
@@ -0,0 +1,113 @@
+from bisect import bisect_left
+
+# Only this many leading characters go into the fuzzy index, which keeps it
+# small for long names; candidates are then checked against the full name
+FUZZY_PREFIX_LENGTH = 7
+
+def normalize_location(name):
+    """Lowercase a location and collapse repeated whitespace"""
+    return ' '.join(name.lower().split())
+
+def bounded_edit_distance(a, b, limit):
+    """Levenshtein distance between a and b, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, start=1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j, char_b in enumerate(b, start=1):
+            current[j] = min(
+                previous[j] + 1,                        # deletion
+                current[j - 1] + 1,                     # insertion
+                previous[j - 1] + (char_a != char_b)    # substitution
+            )
+            row_min = min(row_min, current[j])
+        if row_min > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+def deletes(word, max_distance):
+    """Return every string made by deleting up to max_distance characters from word"""
+    results = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        next_frontier = set()
+        for item in frontier:
+            for i in range(len(item)):
+                next_frontier.add(item[:i] + item[i + 1:])
+        results |= next_frontier
+        frontier = next_frontier
+    return results
+
+class LocationIndex:
+    """Set of known stops with prefix search and "did you mean" suggestions"""
+    
+    def __init__(self, guide):
+        self.names = {}    # normalized name -> name as written in the CSV
+        
+        for route, segments in guide.items():
+            for endpoint in route.split(' - '):
+                self.add(endpoint)
+            for segment in segments:
+                for stop in segment.segment.split(' to '):
+                    self.add(stop)
+        
+        # Sorted keys let prefix search bisect instead of scanning
+        self.sorted_names = sorted(self.names)
+        
+        # Built on the first suggest() call: deleted-prefix variant -> names
+        self.fuzzy_index = None
+        self.fuzzy_distance = 0
+    
+    def add(self, name):
+        """Add one location, keeping the first spelling seen for display"""
+        key = normalize_location(name)
+        if key and key not in self.names:
+            self.names[key] = name.strip()
+    
+    def contains(self, name):
+        """Return True if name is a known location"""
+        return normalize_location(name) in self.names
+    
+    def complete(self, prefix, limit=10):
+        """Return up to `limit` known locations starting with prefix"""
+        prefix = normalize_location(prefix)
+        matches = []
+        index = bisect_left(self.sorted_names, prefix)
+        while index < len(self.sorted_names) and len(matches) < limit:
+            name = self.sorted_names[index]
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+            index += 1
+        return matches
+    
+    def build_fuzzy_index(self, max_distance):
+        """Index every name under all variants of its prefix with characters deleted"""
+        self.fuzzy_index = {}
+        self.fuzzy_distance = max_distance
+        for name in self.sorted_names:
+            for variant in deletes(name[:FUZZY_PREFIX_LENGTH], max_distance):
+                self.fuzzy_index.setdefault(variant, []).append(name)
+    
+    def suggest(self, name, max_distance=2, limit=3):
+        """Return the closest known locations within max_distance edits"""
+        name = normalize_location(name)
+        if self.fuzzy_index is None or self.fuzzy_distance < max_distance:
+            self.build_fuzzy_index(max_distance)
+        
+        # Two strings within N edits share a variant with at most N deletions
+        candidates = set()
+        for variant in deletes(name[:FUZZY_PREFIX_LENGTH], max_distance):
+            candidates.update(self.fuzzy_index.get(variant, ()))
+        
+        scored = []
+        for candidate in candidates:
+            distance = bounded_edit_distance(name, candidate, max_distance)
+            if distance <= max_distance:
+                scored.append((distance, candidate))
+        scored.sort()
+        return [candidate for _, candidate in scored[:limit]]
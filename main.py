@@ -1,11 +1,57 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
-from database import initialize_database
-from session import load_session, clear_session
-from auth import signup, login
-from ui_home import create_home_page
-from ui_track import TrackPage
-from ui_dashboard import DashboardPage
+from startup_timing import phase, mark, print_report
+with phase('import tkinter'):
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+with phase('import app modules'):
+    # Only what the login screen needs; the rest is imported by prewarm() or on first use
+    from database import initialize_database, close_storage
+    from async_db import run_async, submit, shutdown as shutdown_workers
+    from session import SessionManager
+    from auth import signup, login
+    from ui_home import create_home_page
+    from page_manager import PageManager
+    from concurrent.futures import wait
+
+# Start prewarming anyway if the window has not been drawn after this long (e.g. started minimized)
+PREWARM_FALLBACK_MS = 1000
+
+def prewarm(database_ready):
+    """Load what the login screen does not need (runs on a worker thread after the first frame)
+    
+    The database is initialized on another worker at the same time;
+    this returns once that has finished too, so the report covers both.
+    """
+    with phase('replay fare journal'):
+        # Replays fare changes journaled while the database was unreachable
+        from fare_journal import get_sync
+        get_sync()
+    with phase('load fare guide'):
+        from fare_calculator import load_fare_guide
+        load_fare_guide()
+    with phase('start fare watcher'):
+        # Reload fares in the background when fare_data.csv is edited
+        from fare_watcher import start_fare_watcher
+        start_fare_watcher()
+    with phase('import pages'):
+        import ui_track
+        import ui_dashboard
+        import analytics    # numpy, the slowest import by far
+    wait([database_ready])
+
+def timed_initialize_database():
+    """Create or upgrade the schema, recording how long it took"""
+    with phase('initialize database'):
+        return initialize_database()
+
+def build_track_page(parent, navigate, sessions):
+    """Build the Track page, importing it now if prewarm() has not yet"""
+    from ui_track import TrackPage
+    return TrackPage(parent, navigate, sessions)
+
+def build_dashboard_page(parent, navigate, sessions):
+    """Build the Dashboard page, importing it now if prewarm() has not yet"""
+    from ui_dashboard import DashboardPage
+    return DashboardPage(parent, navigate, sessions)
 
 class FareTrackerApp:
     def __init__(self, root):
@@ -14,20 +60,52 @@ class FareTrackerApp:
         self.root.geometry("900x700")
         self.root.configure(bg='#f0f0f0')
         
-        # Initialize database
-        initialize_database()
-        
         # Current page
         self.current_page = None
         self.current_page_widget = None
         
+        # Logged-in users; read from disk once here and written only on login, logout and Switch User
+        self.sessions = SessionManager()
+        self.sessions.restore()
+        
         # Check if user is logged in
-        self.check_session()
+        with phase('build first page'):
+            self.check_session()
+        
+        # F12 opens the latency/profiling debug panel
+        self.debug_panel = None
+        self.root.bind('<F12>', self.open_debug_panel)
+        
+        # Everything else waits until the window is on screen
+        self.prewarm_started = False
+        self.expose_binding = self.root.bind('<Expose>', self.on_first_frame, add='+')
+        self.root.after(PREWARM_FALLBACK_MS, self.start_prewarm)
+    
+    def on_first_frame(self, event):
+        """Note when the window is first drawn and start prewarming"""
+        self.root.unbind('<Expose>', self.expose_binding)
+        mark('first frame drawn')
+        self.root.after_idle(self.start_prewarm)
+    
+    def start_prewarm(self):
+        """Initialize the database and load the other pages' modules in the background"""
+        if self.prewarm_started:
+            return
+        self.prewarm_started = True
+        database_ready = submit(timed_initialize_database)
+        run_async(self.root, prewarm, database_ready, on_success=lambda result: print_report(), on_error=lambda error: print_report())
+    
+    def open_debug_panel(self, event=None):
+        """Show the debug panel, opening it if it is not already open"""
+        from ui_debug import DebugPanel
+        if self.debug_panel and self.debug_panel.window.winfo_exists():
+            self.debug_panel.focus()
+        else:
+            self.debug_panel = DebugPanel(self.root)
     
     def check_session(self):
         """Check if user has active session"""
-        srcode = load_session()
-        if srcode:
+        if self.sessions.current:
             self.show_main_app()
         else:
             self.show_auth_page()
@@ -126,7 +204,7 @@ class FareTrackerApp:
         self.college_entry = tk.Entry(fields_frame, font=('Arial', 11), width=30)
         
         # Submit button
-        submit_btn = tk.Button(
+        self.submit_btn = tk.Button(
             container,
             text="Submit",
             font=('Arial', 12, 'bold'),
@@ -136,7 +214,7 @@ class FareTrackerApp:
             padx=30,
             pady=10
         )
-        submit_btn.pack(pady=20)
+        self.submit_btn.pack(pady=20)
         
         # Initialize auth mode
         self.switch_auth_mode()
@@ -172,12 +250,10 @@ class FareTrackerApp:
                 messagebox.showerror("Error", "Please fill in all fields")
                 return
             
-            success, user, message = login(srcode, password)
-            if success:
-                messagebox.showinfo("Success", message)
-                self.show_main_app()
-            else:
-                messagebox.showerror("Error", message)
+            self.set_auth_busy(True)
+            run_async(self.submit_btn, login, srcode, password,
+                      on_success=lambda result: self.finish_auth(result[0], result[2], srcode, result[1]),
+                      on_error=self.auth_failed)
         else:
             # Signup
             name = self.name_entry.get().strip()
@@ -187,12 +263,32 @@ class FareTrackerApp:
                 messagebox.showerror("Error", "Please fill in all fields")
                 return
             
-            success, message = signup(srcode, name, password, college)
-            if success:
-                messagebox.showinfo("Success", message)
-                self.show_main_app()
-            else:
-                messagebox.showerror("Error", message)
+            self.set_auth_busy(True)
+            run_async(self.submit_btn, signup, srcode, name, password, college,
+                      on_success=lambda result: self.finish_auth(result[0], result[1], srcode),
+                      on_error=self.auth_failed)
+    
+    def set_auth_busy(self, busy):
+        """Show a loading state on the submit button while auth runs"""
+        if busy:
+            self.submit_btn.config(text="Please wait...", state=tk.DISABLED)
+        else:
+            self.submit_btn.config(text="Submit", state=tk.NORMAL)
+    
+    def finish_auth(self, success, message, srcode, user=None):
+        """Handle the result of a background login or signup"""
+        self.set_auth_busy(False)
+        if success:
+            self.sessions.login(srcode, user)
+            messagebox.showinfo("Success", message)
+            self.show_main_app()
+        else:
+            messagebox.showerror("Error", message)
+    
+    def auth_failed(self, error):
+        """Handle an unexpected error from a background login or signup"""
+        self.set_auth_busy(False)
+        messagebox.showerror("Error", "Could not reach the database. Please try again.")
     
     def show_main_app(self):
         """Show main application with navigation"""
@@ -211,6 +307,7 @@ class FareTrackerApp:
             ("Home", "home"),
             ("Track", "track"),
             ("My Dashboard", "dashboard"),
+            ("Switch User", "switch"),
             ("Logout", "logout")
         ]
         
@@ -233,30 +330,29 @@ class FareTrackerApp:
         self.content_frame = tk.Frame(main_container, bg='#f0f0f0')
         self.content_frame.pack(fill=tk.BOTH, expand=True)
         
+        # Pages are built on first visit and kept for the rest of this session
+        self.pages = PageManager(self.content_frame)
+        self.pages.register("home", lambda parent: create_home_page(parent, self.navigate))
+        self.pages.register("track", lambda parent: build_track_page(parent, self.navigate, self.sessions))
+        self.pages.register("dashboard", lambda parent: build_dashboard_page(parent, self.navigate, self.sessions))
+        
         # Show home page by default
         self.navigate("home")
     
     def navigate(self, page):
         """Navigate to different pages"""
-        # Clear current page
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
-        
-        if page == "home":
-            home_frame = create_home_page(self.content_frame, self.navigate)
-            home_frame.pack(fill=tk.BOTH, expand=True)
+        if page in self.pages.builders:
+            self.pages.show(page)
         
-        elif page == "track":
-            track_page = TrackPage(self.content_frame, self.navigate)
-            track_page.get_frame().pack(fill=tk.BOTH, expand=True)
-        
-        elif page == "dashboard":
-            dashboard_page = DashboardPage(self.content_frame, self.navigate)
-            dashboard_page.get_frame().pack(fill=tk.BOTH, expand=True)
+        elif page == "switch":
+            # Keep this user's session open; getting back to it needs their password
+            self.sessions.lock()
+            self.show_auth_page()
         
         elif page == "logout":
             if messagebox.askyesno("Logout", "Are you sure you want to logout?"):
-                clear_session()
+                # Always back to the login screen, never into another user's session
+                self.sessions.logout()
                 self.show_auth_page()
     
     def clear_page(self):
@@ -266,9 +362,18 @@ class FareTrackerApp:
         self.current_page_widget = None
 
 def main():
-    root = tk.Tk()
+    with phase('create window'):
+        root = tk.Tk()
     app = FareTrackerApp(root)
     root.mainloop()
+    
+    # Stop whatever prewarm() started
+    from fare_watcher import stop_fare_watcher
+    from fare_journal import stop_write_queue
+    stop_fare_watcher()
+    shutdown_workers()
+    stop_write_queue()
+    close_storage()
 
 if __name__ == "__main__":
     main()
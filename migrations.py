@@ -0,0 +1,218 @@
+import argparse
+import sys
+from database import get_storage, rebuild_daily_totals
+
+# MySQL error number for "Unknown database"
+ER_BAD_DB_ERROR = 1049
+
+def create_tables(cursor):
+    """Create the users and fare_history tables"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            srcode VARCHAR(50) PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            password VARCHAR(100) NOT NULL,
+            college VARCHAR(100) NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fare_history (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            srcode VARCHAR(50) NOT NULL,
+            district INT NOT NULL,
+            start_location VARCHAR(100) NOT NULL,
+            destination VARCHAR(100) NOT NULL,
+            include_trike VARCHAR(1) NOT NULL,
+            total_fare DECIMAL(10, 2) NOT NULL,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (srcode) REFERENCES users(srcode) ON DELETE CASCADE
+        )
+    """)
+
+def create_daily_totals(cursor):
+    """Create the per-user daily rollup table and backfill it from fare history"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS fare_daily_totals (
+            srcode VARCHAR(50) NOT NULL,
+            day DATE NOT NULL,
+            total_fare DECIMAL(12, 2) NOT NULL,
+            trips INT NOT NULL,
+            PRIMARY KEY (srcode, day),
+            FOREIGN KEY (srcode) REFERENCES users(srcode) ON DELETE CASCADE
+        )
+    """)
+    cursor.execute("DELETE FROM fare_daily_totals")
+    cursor.execute("""
+        INSERT INTO fare_daily_totals (srcode, day, total_fare, trips)
+        SELECT srcode, DATE(created_date), SUM(total_fare), COUNT(*)
+        FROM fare_history
+        GROUP BY srcode, DATE(created_date)
+    """)
+
+def index_exists(cursor, table, index_name):
+    """Return True if the table already has an index with this name"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index_name))
+    return cursor.fetchone()[0] > 0
+
+def create_index(table, index_name, columns, unique=False):
+    """Return a migration step that adds an index unless it already exists"""
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    def step(cursor):
+        if not index_exists(cursor, table, index_name):
+            cursor.execute(f"CREATE {kind} {index_name} ON {table} ({columns})")
+    return step
+
+def drop_index(table, index_name):
+    """Return a migration step that drops an index if it exists"""
+    def step(cursor):
+        if index_exists(cursor, table, index_name):
+            cursor.execute(f"DROP INDEX {index_name} ON {table}")
+    return step
+
+def column_exists(cursor, table, column):
+    """Return True if the table already has this column"""
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+    return cursor.fetchone()[0] > 0
+
+def add_column(table, column, definition):
+    """Return a migration step that adds a column unless it already exists"""
+    def step(cursor):
+        if not column_exists(cursor, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+    return step
+
+# (version, description, steps) in the order they must be applied
+MIGRATIONS = [
+    (1, "Create users and fare_history tables", [create_tables]),
+    (2, "Index fare history by user and date for paged history",
+     [create_index('fare_history', 'idx_fare_history_user_date', 'srcode, created_date, id')]),
+    (3, "Covering index for weekly totals",
+     [create_index('fare_history', 'idx_fare_history_user_date_fare', 'srcode, created_date, total_fare')]),
+    (4, "Per-user daily fare rollups", [create_daily_totals]),
+    (5, "Idempotency keys for journaled fare saves",
+     [add_column('fare_history', 'client_key', 'CHAR(32) NULL'),
+      create_index('fare_history', 'idx_fare_history_client_key', 'client_key', unique=True)]),
+    # Totals come from fare_daily_totals since version 4, so nothing reads this index any more
+    (6, "Drop the unused weekly totals covering index",
+     [drop_index('fare_history', 'idx_fare_history_user_date_fare')]),
+]
+
+# Hot queries and the indexes EXPLAIN should show them using
+HOT_QUERIES = [
+    ("history page", """
+        SELECT id, created_date, district, start_location, destination, include_trike, total_fare
+        FROM fare_history WHERE srcode = %s
+        ORDER BY created_date DESC, id DESC LIMIT 50
+    """, ('idx_fare_history_user_date',)),
+    ("history count", """
+        SELECT COUNT(*) FROM fare_history WHERE srcode = %s
+    """, ('idx_fare_history_user_date', 'srcode')),
+    ("weekly totals", """
+        SELECT COALESCE(SUM(total_fare), 0), COALESCE(SUM(trips), 0) FROM fare_daily_totals
+        WHERE srcode = %s AND day >= DATE_SUB(CURDATE(), INTERVAL 6 DAY)
+    """, ('PRIMARY',)),
+]
+
+def create_database_if_missing(db_config):
+    """Create the configured database if the server does not have it yet"""
+    # Imported here so the migrations CLI also runs for the sqlite backend
+    import mysql.connector
+    config = dict(db_config)
+    database = config.pop('database')
+    connection = mysql.connector.connect(**config)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+        cursor.close()
+    finally:
+        connection.close()
+
+def current_version(cursor):
+    """Return the highest applied migration version, creating the version table if needed"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(200) NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+def migrate(storage):
+    """Apply every migration newer than the database's version (MySQL storage)"""
+    try:
+        try:
+            with storage.cursor(commit=True) as cursor:
+                version = current_version(cursor)
+        except storage.Error as e:
+            if e.errno != ER_BAD_DB_ERROR:
+                raise
+            create_database_if_missing(storage.db_config)
+            with storage.cursor(commit=True) as cursor:
+                version = current_version(cursor)
+        
+        for migration_version, description, steps in MIGRATIONS:
+            if migration_version <= version:
+                continue
+            with storage.cursor(commit=True) as cursor:
+                for step in steps:
+                    step(cursor)
+                cursor.execute("""
+                    INSERT INTO schema_migrations (version, description) VALUES (%s, %s)
+                """, (migration_version, description))
+            print(f"Applied migration {migration_version}: {description}")
+        return True
+    except storage.Error as e:
+        print(f"Error migrating database: {e}")
+        return False
+
+def verify_indexes(storage, srcode='0'):
+    """EXPLAIN the hot queries and return a list of those not using their index"""
+    problems = []
+    try:
+        with storage.cursor(dictionary=True) as cursor:
+            for name, query, expected in HOT_QUERIES:
+                cursor.execute("EXPLAIN " + query, (srcode,))
+                plan = cursor.fetchall()
+                used = [row.get('key') for row in plan]
+                if not any(key in expected for key in used):
+                    problems.append(f"{name}: expected one of {', '.join(expected)} but EXPLAIN shows {used}")
+    except storage.Error as e:
+        problems.append(f"could not run EXPLAIN: {e}")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database migrations")
+    parser.add_argument('--verify', action='store_true', help="check with EXPLAIN that hot queries use their indexes")
+    parser.add_argument('--rebuild-rollups', action='store_true', help="recompute daily fare totals from fare history")
+    args = parser.parse_args()
+    
+    # Embedded backends upgrade their own schema; MySQL comes back through migrate()
+    storage = get_storage()
+    if not storage.initialize():
+        sys.exit(1)
+    
+    if args.rebuild_rollups:
+        if not rebuild_daily_totals():
+            sys.exit(1)
+        print("Rebuilt daily fare totals")
+    
+    if args.verify and storage.name != 'mysql':
+        print("Index verification only applies to the MySQL backend")
+    elif args.verify:
+        problems = verify_indexes(storage)
+        for problem in problems:
+            print(f"  {problem}")
+        if problems:
+            sys.exit(1)
+        print("All hot queries use their indexes")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+class PageManager:
+    """Builds each page once and switches between them by raising the cached frame
+    
+    A page is a widget or an object with get_frame(). If it has an on_show()
+    method, that is called every time the page is shown so it can refresh
+    whatever has gone stale.
+    """
+    
+    def __init__(self, container):
+        self.container = container
+        self.container.grid_rowconfigure(0, weight=1)
+        self.container.grid_columnconfigure(0, weight=1)
+        self.builders = {}    # name -> function(container) returning a page
+        self.pages = {}       # name -> page, once built
+        self.current = None
+    
+    def register(self, name, builder):
+        """Add a page that is built the first time it is shown"""
+        self.builders[name] = builder
+    
+    def frame_of(self, page):
+        """Return the top-level frame of a page"""
+        return page.get_frame() if hasattr(page, 'get_frame') else page
+    
+    def show(self, name):
+        """Show a page, building it on first use"""
+        page = self.pages.get(name)
+        if page is None:
+            page = self.builders[name](self.container)
+            self.pages[name] = page
+            # Every page sits in the same cell; the raised one is visible
+            self.frame_of(page).grid(row=0, column=0, sticky='nsew')
+        
+        self.frame_of(page).tkraise()
+        self.current = name
+        on_show = getattr(page, 'on_show', None)
+        if on_show:
+            on_show()
+        return page
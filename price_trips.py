@@ -0,0 +1,121 @@
+import argparse
+import csv
+import json
+import sys
+from contextlib import redirect_stdout
+from itertools import islice
+from fare_calculator import load_fare_guide, price_trips
+from instrumentation import timer
+
+# Trips priced (and saved) per chunk; memory use stays bounded by this
+CHUNK_SIZE = 1000
+
+FIELDS = ['district', 'start', 'destination', 'trike']
+OUTPUT_FIELDS = ['srcode'] + FIELDS + ['total_fare', 'route', 'error']
+
+def read_trips(path, file_format):
+    """Yield trip rows (dicts) from a CSV or JSONL file, or stdin for '-'"""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    try:
+        if file_format == 'jsonl':
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            for row in csv.DictReader(f):
+                yield row
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def chunks(iterable, size):
+    """Split an iterable into lists of at most `size` items"""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def price_chunk(rows, default_srcode):
+    """Price one chunk of trip rows, returning output rows"""
+    trips = [tuple(str(row.get(field) or '').strip() for field in FIELDS) for row in rows]
+    results = []
+    # price_trips() is lazy, so the pricing happens while this loop consumes it
+    with timer('fares.price_chunk'):
+        for row, trip, (total_fare, route_details, error) in zip(rows, trips, price_trips(trips)):
+            results.append({
+                'srcode': str(row.get('srcode') or default_srcode or ''),
+                'district': trip[0],
+                'start': trip[1].lower(),
+                'destination': trip[2].lower(),
+                'trike': (trip[3] or 'n').lower(),
+                'total_fare': f"{total_fare:.2f}" if total_fare is not None else '',
+                'route': ' > '.join(detail.segment for detail in route_details) if route_details else '',
+                'error': error or ''
+            })
+    return results
+
+def save_chunk(results):
+    """Insert the priced trips of one chunk into fare_history, returning how many were saved"""
+    # Imported here so pricing alone works without MySQL installed
+    from database import save_fare_records
+    
+    records = [
+        (row['srcode'], int(row['district']), row['start'], row['destination'],
+         row['trike'], float(row['total_fare']))
+        for row in results
+        if not row['error'] and row['srcode']
+    ]
+    return save_fare_records(records)
+
+def main():
+    parser = argparse.ArgumentParser(description="Price a file of trips in bulk")
+    parser.add_argument('input', help="CSV or JSONL file of trips ('-' for stdin)")
+    parser.add_argument('-o', '--output', default='-', help="file to write results to (default: stdout)")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="input/output format (default: from file extension)")
+    parser.add_argument('--srcode', help="SRCODE for rows that have no srcode column")
+    parser.add_argument('--save', action='store_true', help="also insert priced trips into fare_history")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="trips priced per chunk")
+    args = parser.parse_args()
+    
+    file_format = args.format or ('jsonl' if args.input.endswith('.jsonl') else 'csv')
+    
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8', newline='')
+    writer = csv.DictWriter(out, fieldnames=OUTPUT_FIELDS) if file_format == 'csv' else None
+    
+    priced = failed = saved = 0
+    try:
+        # Status messages from the loader and database go to stderr so they
+        # never end up mixed into results written to stdout
+        with redirect_stdout(sys.stderr):
+            if not load_fare_guide():
+                print("Error: could not load fare data")
+                sys.exit(1)
+            
+            if writer:
+                writer.writeheader()
+            for rows in chunks(read_trips(args.input, file_format), args.chunk_size):
+                results = price_chunk(rows, args.srcode)
+                for row in results:
+                    if writer:
+                        writer.writerow(row)
+                    else:
+                        out.write(json.dumps(row) + '\n')
+                    if row['error']:
+                        failed += 1
+                    else:
+                        priced += 1
+                if args.save:
+                    saved += save_chunk(results)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    
+    summary = f"Priced {priced} trips, {failed} failed"
+    if args.save:
+        summary += f", saved {saved}"
+    print(summary, file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
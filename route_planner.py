@@ -0,0 +1,80 @@
+import heapq
+from fare_route import Route
+
+# Graphs with at most this many stops get a precomputed all-pairs table
+ALL_PAIRS_LIMIT = 300
+
+class RoutePlanner:
+    """Cheapest-path search over every segment in the fare guide"""
+    
+    def __init__(self, guide):
+        self.names = {}    # lowercase stop -> name as written in the CSV
+        self.edges = {}    # stop -> {next stop: FareLeg}
+        
+        for segments in guide.values():
+            for segment in segments:
+                self.add_segment(segment)
+        
+        # For small graphs answer every query with a table lookup
+        self.all_pairs = None
+        if len(self.names) <= ALL_PAIRS_LIMIT:
+            self.all_pairs = {stop: self.shortest_paths(stop) for stop in self.names}
+    
+    def add_segment(self, segment):
+        """Add a "X to Y" segment as a directed edge, keeping the cheapest per pair"""
+        parts = segment.segment.split(' to ')
+        if len(parts) != 2:
+            return
+        origin, target = parts[0].strip(), parts[1].strip()
+        origin_key, target_key = origin.lower(), target.lower()
+        
+        self.names.setdefault(origin_key, origin)
+        self.names.setdefault(target_key, target)
+        self.edges.setdefault(target_key, {})
+        
+        neighbors = self.edges.setdefault(origin_key, {})
+        if target_key not in neighbors or segment.fare < neighbors[target_key].fare:
+            neighbors[target_key] = segment
+    
+    def shortest_paths(self, source):
+        """Run Dijkstra from source, returning (cost, previous stop) maps"""
+        cost = {source: 0.0}
+        previous = {}
+        heap = [(0.0, source)]
+        
+        while heap:
+            fare_so_far, stop = heapq.heappop(heap)
+            if fare_so_far > cost.get(stop, float('inf')):
+                continue  # Stale heap entry
+            for next_stop, leg in self.edges.get(stop, {}).items():
+                new_cost = fare_so_far + leg.fare
+                if new_cost < cost.get(next_stop, float('inf')):
+                    cost[next_stop] = new_cost
+                    previous[next_stop] = stop
+                    heapq.heappush(heap, (new_cost, next_stop))
+        
+        return cost, previous
+    
+    def cheapest_route(self, start, destination):
+        """Return the cheapest chain of segments from start to destination as a Route, or None"""
+        start = start.lower().strip()
+        destination = destination.lower().strip()
+        if start not in self.edges or destination not in self.edges or start == destination:
+            return None
+        
+        if self.all_pairs is not None:
+            cost, previous = self.all_pairs[start]
+        else:
+            cost, previous = self.shortest_paths(start)
+        if destination not in cost:
+            return None
+        
+        # Walk back from the destination to rebuild the chain
+        legs = []
+        stop = destination
+        while stop != start:
+            origin = previous[stop]
+            legs.append(self.edges[origin][stop])
+            stop = origin
+        legs.reverse()
+        return Route(legs)
@@ -1,36 +1,130 @@
+import json
 import os
+from datetime import datetime
 
 SESSION_FILE = "session.txt"
 
-def save_session(srcode):
-    """Save SRCODE to session file"""
-    try:
-        with open(SESSION_FILE, 'w') as f:
-            f.write(srcode)
-        return True
-    except Exception as e:
-        print(f"Error saving session: {e}")
-        return False
-
-def load_session():
-    """Load SRCODE from session file"""
-    try:
-        if os.path.exists(SESSION_FILE):
-            with open(SESSION_FILE, 'r') as f:
-                srcode = f.read().strip()
-                return srcode if srcode else None
-        return None
-    except Exception as e:
-        print(f"Error loading session: {e}")
-        return None
-
-def clear_session():
-    """Delete session file"""
-    try:
-        if os.path.exists(SESSION_FILE):
-            os.remove(SESSION_FILE)
-        return True
-    except Exception as e:
-        print(f"Error clearing session: {e}")
-        return False
+# Most sessions kept open at once; the oldest ones nobody is using are closed beyond this
+MAX_SESSIONS = 10
 
+class Session:
+    """One logged-in user: their SRCODE, cached user row and login time"""
+
+    def __init__(self, srcode, user=None, login_time=None):
+        self.srcode = srcode
+        self.user = user
+        self.login_time = login_time or datetime.now()
+
+class SessionManager:
+    """In-memory sessions for this process, persisted to disk only on login, logout and lock
+
+    Several users can be logged in at once (e.g. a shared kiosk); one of
+    them is the current session the pages act for. Making a session
+    current always goes through login(), after the password was checked.
+    """
+
+    def __init__(self, path=SESSION_FILE):
+        self.path = path
+        self.sessions = {}    # srcode -> Session, in login order
+        self.current = None
+
+    def restore(self):
+        """Load the sessions saved by a previous run (called once at startup)"""
+        try:
+            if not os.path.exists(self.path):
+                return self.current
+            with open(self.path, 'r') as f:
+                text = f.read().strip()
+        except Exception as e:
+            print(f"Error loading session: {e}")
+            return self.current
+
+        try:
+            data = json.loads(text)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            # Older versions stored just the SRCODE (which may look like a JSON number)
+            data = {'current': text, 'sessions': [{'srcode': text}]} if text else {}
+
+        try:
+            for entry in data.get('sessions', []):
+                login_time = entry.get('login_time')
+                session = Session(str(entry['srcode']), login_time=datetime.fromisoformat(login_time) if login_time else None)
+                self.sessions[session.srcode] = session
+            self.current = self.sessions.get(data.get('current'))
+        except Exception as e:
+            print(f"Error loading session: {e}")
+            self.sessions = {}
+            self.current = None
+            return self.current
+
+        self.prune()
+        return self.current
+
+    def save(self):
+        """Write the sessions to disk atomically (temp file + rename)"""
+        data = {
+            'current': self.current.srcode if self.current else None,
+            'sessions': [
+                {'srcode': session.srcode, 'login_time': session.login_time.isoformat()}
+                for session in self.sessions.values()
+            ]
+        }
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"Error saving session: {e}")
+            return False
+
+    def login(self, srcode, user=None):
+        """Start (or resume) a session for srcode and make it current"""
+        session = self.sessions.pop(srcode, None) or Session(srcode)
+        if user is not None:
+            session.user = user
+        self.sessions[srcode] = session
+        self.current = session
+        self.prune()
+        self.save()
+        return session
+
+    def logout(self, srcode=None):
+        """End a session (the current one by default)
+
+        Nobody is current afterwards: other open sessions are only resumed
+        by logging in again with that user's password.
+        """
+        srcode = srcode or self.current_srcode()
+        session = self.sessions.pop(srcode, None)
+        if session is self.current:
+            self.current = None
+        self.save()
+        return self.current
+
+    def lock(self):
+        """Keep the current session open but require a login to return to it (e.g. "Switch User")
+
+        Saved so a restart does not go straight back into the locked session.
+        """
+        if self.current is None:
+            return
+        self.current = None
+        self.save()
+
+    def prune(self):
+        """Close the oldest sessions other than the current one while there are more than MAX_SESSIONS"""
+        for srcode in list(self.sessions):
+            if len(self.sessions) <= MAX_SESSIONS:
+                break
+            if self.sessions[srcode] is not self.current:
+                del self.sessions[srcode]
+
+    def current_srcode(self):
+        """Return the current session's SRCODE, or None if nobody is logged in"""
+        return self.current.srcode if self.current else None
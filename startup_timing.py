@@ -0,0 +1,51 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Set FARETRACKER_STARTUP_REPORT=1 to print where startup time went
+STARTUP_REPORT = os.environ.get('FARETRACKER_STARTUP_REPORT', '') not in ('', '0')
+
+# Imported first by main.py, so times are measured from when the app started loading
+_started = time.perf_counter()
+_lock = threading.Lock()
+_entries = []    # (started_at, seconds or None for a milestone, name, thread name)
+
+def elapsed():
+    """Seconds since startup began"""
+    return time.perf_counter() - _started
+
+def _record(started_at, seconds, name):
+    with _lock:
+        _entries.append((started_at, seconds, name, threading.current_thread().name))
+
+@contextmanager
+def phase(name):
+    """Time a block of startup work"""
+    started_at = elapsed()
+    try:
+        yield
+    finally:
+        _record(started_at, elapsed() - started_at, name)
+
+def mark(name):
+    """Record a point in time, such as the first frame being drawn"""
+    _record(elapsed(), None, name)
+
+def report():
+    """Return the recorded phases and milestones as text lines, in start order"""
+    with _lock:
+        entries = sorted(_entries)
+    lines = ["Startup timing (ms since the app started loading):"]
+    for started_at, seconds, name, thread in entries:
+        where = "" if thread == 'MainThread' else f"  [{thread}]"
+        if seconds is None:
+            lines.append(f"  {started_at * 1000:8.1f}  * {name}{where}")
+        else:
+            lines.append(f"  {started_at * 1000:8.1f}  {seconds * 1000:7.1f} ms  {name}{where}")
+    return lines
+
+def print_report():
+    """Print the report if FARETRACKER_STARTUP_REPORT is set"""
+    if STARTUP_REPORT:
+        print("\n".join(report()))
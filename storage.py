@@ -0,0 +1,114 @@
+from datetime import datetime
+
+# Columns shown in the fare history table
+FARE_COLUMNS = "id, created_date, district, start_location, destination, include_trike, total_fare"
+
+# Record timestamps are local-time text in this format, which sorts in date order
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+def creation_times(records, created=None):
+    """Return each record's timestamp text: the one given in `created`, or now if it has none"""
+    now = datetime.now().strftime(TIMESTAMP_FORMAT)
+    if not created:
+        return [now] * len(records)
+    return [stamp or now for stamp in created]
+
+def daily_totals(records, created):
+    """Sum fare record tuples per user and day, as (srcode, day, total, trips) rows for the rollups"""
+    totals = {}
+    for record, stamp in zip(records, created):
+        # The day is the date part of the record's timestamp
+        key = (record[0], stamp[:10])
+        total, trips = totals.get(key, (0.0, 0))
+        totals[key] = (total + float(record[5]), trips + 1)
+    return [(srcode, day, total, trips) for (srcode, day), (total, trips) in totals.items()]
+
+def unsaved(records, keys, created, saved_keys):
+    """Return the (records, keys, created) whose key is not in saved_keys"""
+    rows = [row for row in zip(records, keys, created) if row[1] not in saved_keys]
+    return [row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]
+
+class Storage:
+    """Interface the CRUD functions in database.py call into
+    
+    A backend runs the queries for one database engine. Methods raise the
+    backend's own driver error, which is exposed as the `Error` attribute
+    so database.py can catch it without importing any driver itself.
+    `PermanentError` is the tuple of driver errors that retrying cannot
+    fix (the database refused the data itself, e.g. a foreign key or
+    constraint violation), as opposed to connection problems and timeouts.
+    """
+    
+    name = None
+    Error = Exception
+    PermanentError = ()
+    
+    def initialize(self):
+        """Create or upgrade the schema, returning True on success"""
+        raise NotImplementedError
+    
+    def close(self):
+        """Release every connection the backend holds"""
+        raise NotImplementedError
+    
+    # Users
+    
+    def create_user(self, srcode, name, password, college):
+        """Insert a user"""
+        raise NotImplementedError
+    
+    def get_user(self, srcode):
+        """Return a user row as a dict, or None"""
+        raise NotImplementedError
+    
+    def update_college(self, srcode, new_college):
+        """Change a user's college"""
+        raise NotImplementedError
+    
+    # Fare history
+    
+    def save_fare_records(self, records, keys=None, created=None):
+        """Insert fare record tuples and add them to their days' rollups, in one transaction
+        
+        `keys` optionally gives each record an idempotency key. Records whose
+        key is already stored are skipped, so a resent batch is not saved
+        twice. `created` optionally gives each record the TIMESTAMP_FORMAT
+        time it was taken; records without one are stamped now. The rollups
+        are computed from the records that are inserted (see daily_totals()).
+        Returns how many records were inserted.
+        """
+        raise NotImplementedError
+    
+    def get_user_fares(self, srcode):
+        """Return all of a user's fare rows as dicts, newest first"""
+        raise NotImplementedError
+    
+    def get_user_fares_page(self, srcode, limit, after=None):
+        """Return one keyset page of FARE_COLUMNS rows as dicts, newest first"""
+        raise NotImplementedError
+    
+    def count_user_fares(self, srcode):
+        """Return how many fare records a user has"""
+        raise NotImplementedError
+    
+    def delete_fare_record(self, record_id):
+        """Delete a fare record and take it out of its day's rollup"""
+        raise NotImplementedError
+    
+    def get_fare_rows(self, srcode=None, college=None):
+        """Return (created_seconds, total_fare, district, start, destination, trike) rows"""
+        raise NotImplementedError
+    
+    # Daily rollups
+    
+    def get_fare_totals(self, srcode, days):
+        """Return (total, trips) over the last `days` calendar days"""
+        raise NotImplementedError
+    
+    def get_fare_totals_between(self, srcode, start_day, end_day):
+        """Return (total, trips) from start_day to end_day inclusive"""
+        raise NotImplementedError
+    
+    def rebuild_daily_totals(self, srcode=None):
+        """Recompute rollups from raw history (all users, or one)"""
+        raise NotImplementedError
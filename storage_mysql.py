@@ -0,0 +1,283 @@
+import threading
+import time
+from contextlib import contextmanager
+import mysql.connector
+from mysql.connector import Error, IntegrityError, DataError
+from storage import Storage, FARE_COLUMNS, creation_times, daily_totals, unsaved
+from instrumentation import timer
+
+class ConnectionPool:
+    """Bounded pool of reusable MySQL connections"""
+    
+    def __init__(self, db_config, pool_size, acquire_timeout, ping_after):
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.acquire_timeout = acquire_timeout
+        self.ping_after = ping_after
+        self._idle = []          # (connection, last_used) pairs, most recent last
+        self._open_count = 0
+        self._condition = threading.Condition()
+    
+    def acquire(self):
+        """Borrow a healthy connection, opening a new one if the pool has room"""
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._condition:
+            while True:
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._open_count < self.pool_size:
+                    self._open_count += 1
+                    connection, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Error(msg="Timed out waiting for a database connection")
+                self._condition.wait(remaining)
+        
+        try:
+            if connection is None:
+                return mysql.connector.connect(**self.db_config)
+            
+            # Connections that sat idle may have been dropped by the server
+            if time.monotonic() - last_used > self.ping_after:
+                connection.ping(reconnect=True, attempts=1)
+            return connection
+        except Exception:
+            self._discard(connection)
+            raise
+    
+    def release(self, connection, broken=False):
+        """Return a connection to the pool, closing it if it is broken"""
+        if broken:
+            self._discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+    
+    def _discard(self, connection):
+        """Close a connection and free its slot"""
+        if connection is not None:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        with self._condition:
+            self._open_count -= 1
+            self._condition.notify()
+    
+    def close_all(self):
+        """Close every idle connection"""
+        with self._condition:
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+        for connection, _ in idle:
+            try:
+                connection.close()
+            except Exception:
+                pass
+
+class MySQLStorage(Storage):
+    """Storage backend for a MySQL server, using a pool of connections"""
+    
+    name = 'mysql'
+    Error = Error
+    PermanentError = (IntegrityError, DataError)
+    
+    def __init__(self, db_config, pool_config):
+        self.db_config = db_config
+        self.pool = ConnectionPool(db_config, **pool_config)
+    
+    @contextmanager
+    def cursor(self, dictionary=False, commit=False):
+        """Borrow a pooled connection and yield a cursor on it
+        
+        Commits on success when commit=True and rolls back on error. Reads
+        are rolled back too, ending their transaction so the connection's
+        next user sees a fresh snapshot (InnoDB's REPEATABLE READ would
+        otherwise keep the first one). Raises mysql.connector.Error if no
+        connection can be made.
+        """
+        try:
+            # Includes waiting for a free slot, opening new connections and pinging idle ones
+            with timer('db.acquire_connection'):
+                connection = self.pool.acquire()
+        except Error as e:
+            print(f"Error connecting to MySQL: {e}")
+            print(f"Please ensure MySQL is running and database '{self.db_config['database']}' exists")
+            raise
+        
+        broken = False
+        cursor = None
+        try:
+            cursor = connection.cursor(dictionary=dictionary)
+            yield cursor
+            if commit:
+                connection.commit()
+            else:
+                connection.rollback()
+        except Exception:
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True
+            raise
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    broken = True
+            self.pool.release(connection, broken)
+    
+    def initialize(self):
+        # Imported here because migrations builds on this module
+        from migrations import migrate
+        return migrate(self)
+    
+    def close(self):
+        self.pool.close_all()
+    
+    def create_user(self, srcode, name, password, college):
+        with self.cursor(commit=True) as cursor:
+            cursor.execute("""
+                INSERT INTO users (srcode, name, password, college)
+                VALUES (%s, %s, %s, %s)
+            """, (srcode, name, password, college))
+    
+    def get_user(self, srcode):
+        with self.cursor(dictionary=True) as cursor:
+            cursor.execute("SELECT * FROM users WHERE srcode = %s", (srcode,))
+            return cursor.fetchone()
+    
+    def update_college(self, srcode, new_college):
+        with self.cursor(commit=True) as cursor:
+            cursor.execute("""
+                UPDATE users SET college = %s WHERE srcode = %s
+            """, (new_college, srcode))
+    
+    def save_fare_records(self, records, keys=None, created=None):
+        # History rows and rollups use the same timestamps, so they agree on the day
+        created = creation_times(records, created)
+        with self.cursor(commit=True) as cursor:
+            if keys:
+                # Skip records a previous attempt already committed
+                placeholders = ', '.join(['%s'] * len(keys))
+                cursor.execute(f"SELECT client_key FROM fare_history WHERE client_key IN ({placeholders})", list(keys))
+                records, keys, created = unsaved(records, keys, created, {row[0] for row in cursor.fetchall()})
+                if not records:
+                    return 0
+            else:
+                keys = [None] * len(records)
+            
+            cursor.executemany("""
+                INSERT INTO fare_history (srcode, district, start_location, destination, include_trike, total_fare, client_key, created_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+            """, [record + (key, stamp) for record, key, stamp in zip(records, keys, created)])
+            cursor.executemany("""
+                INSERT INTO fare_daily_totals (srcode, day, total_fare, trips)
+                VALUES (%s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE total_fare = total_fare + VALUES(total_fare), trips = trips + VALUES(trips)
+            """, daily_totals(records, created))
+            return len(records)
+    
+    def get_user_fares(self, srcode):
+        with self.cursor(dictionary=True) as cursor:
+            cursor.execute("""
+                SELECT * FROM fare_history
+                WHERE srcode = %s
+                ORDER BY created_date DESC
+            """, (srcode,))
+            return cursor.fetchall()
+    
+    def get_user_fares_page(self, srcode, limit, after=None):
+        with self.cursor(dictionary=True) as cursor:
+            if after is None:
+                cursor.execute(f"""
+                    SELECT {FARE_COLUMNS} FROM fare_history
+                    WHERE srcode = %s
+                    ORDER BY created_date DESC, id DESC
+                    LIMIT %s
+                """, (srcode, limit))
+            else:
+                last_date, last_id = after
+                cursor.execute(f"""
+                    SELECT {FARE_COLUMNS} FROM fare_history
+                    WHERE srcode = %s
+                      AND (created_date < %s OR (created_date = %s AND id < %s))
+                    ORDER BY created_date DESC, id DESC
+                    LIMIT %s
+                """, (srcode, last_date, last_date, last_id, limit))
+            return cursor.fetchall()
+    
+    def count_user_fares(self, srcode):
+        with self.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM fare_history WHERE srcode = %s", (srcode,))
+            return cursor.fetchone()[0]
+    
+    def delete_fare_record(self, record_id):
+        with self.cursor(commit=True) as cursor:
+            cursor.execute("""
+                SELECT srcode, DATE(created_date), total_fare FROM fare_history
+                WHERE id = %s FOR UPDATE
+            """, (record_id,))
+            row = cursor.fetchone()
+            cursor.execute("DELETE FROM fare_history WHERE id = %s", (record_id,))
+            
+            # Take the record back out of its day's rollup
+            if row:
+                srcode, day, total_fare = row
+                cursor.execute("""
+                    UPDATE fare_daily_totals SET total_fare = total_fare - %s, trips = trips - 1
+                    WHERE srcode = %s AND day = %s
+                """, (total_fare, srcode, day))
+                cursor.execute("""
+                    DELETE FROM fare_daily_totals WHERE srcode = %s AND day = %s AND trips <= 0
+                """, (srcode, day))
+    
+    def get_fare_rows(self, srcode=None, college=None):
+        select = """
+            SELECT TIMESTAMPDIFF(SECOND, '1970-01-01', f.created_date), CAST(f.total_fare AS DOUBLE),
+                   f.district, f.start_location, f.destination, f.include_trike
+            FROM fare_history f
+        """
+        if srcode:
+            query = select + " WHERE f.srcode = %s ORDER BY f.created_date"
+            params = (srcode,)
+        else:
+            query = select + " JOIN users u ON u.srcode = f.srcode WHERE u.college = %s ORDER BY f.created_date"
+            params = (college,)
+        with self.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+    
+    def get_fare_totals(self, srcode, days):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(total_fare), 0), COALESCE(SUM(trips), 0)
+                FROM fare_daily_totals
+                WHERE srcode = %s AND day >= DATE_SUB(CURDATE(), INTERVAL %s DAY)
+            """, (srcode, days - 1))
+            return cursor.fetchone()
+    
+    def get_fare_totals_between(self, srcode, start_day, end_day):
+        with self.cursor() as cursor:
+            cursor.execute("""
+                SELECT COALESCE(SUM(total_fare), 0), COALESCE(SUM(trips), 0)
+                FROM fare_daily_totals
+                WHERE srcode = %s AND day BETWEEN %s AND %s
+            """, (srcode, start_day, end_day))
+            return cursor.fetchone()
+    
+    def rebuild_daily_totals(self, srcode=None):
+        where = "WHERE srcode = %s" if srcode else ""
+        params = (srcode,) if srcode else ()
+        with self.cursor(commit=True) as cursor:
+            cursor.execute(f"DELETE FROM fare_daily_totals {where}", params)
+            cursor.execute(f"""
+                INSERT INTO fare_daily_totals (srcode, day, total_fare, trips)
+                SELECT srcode, DATE(created_date), SUM(total_fare), COUNT(*)
+                FROM fare_history {where}
+                GROUP BY srcode, DATE(created_date)
+            """, params)
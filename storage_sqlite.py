@@ -0,0 +1,279 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+from storage import Storage, FARE_COLUMNS, TIMESTAMP_FORMAT, creation_times, daily_totals, unsaved
+from instrumentation import timer
+
+# Compiled statements kept per connection; every query below is a fixed
+# string with ? parameters, so repeat calls reuse the prepared statement
+STATEMENT_CACHE_SIZE = 64
+
+# (user_version, statements) applied in order; PRAGMA user_version records progress
+SCHEMA = [
+    (1, [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            srcode TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            password TEXT NOT NULL,
+            college TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS fare_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            srcode TEXT NOT NULL REFERENCES users(srcode) ON DELETE CASCADE,
+            district INTEGER NOT NULL,
+            start_location TEXT NOT NULL,
+            destination TEXT NOT NULL,
+            include_trike TEXT NOT NULL,
+            total_fare REAL NOT NULL,
+            created_date TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fare_history_user_date ON fare_history (srcode, created_date, id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_college ON users (college)",
+        """
+        CREATE TABLE IF NOT EXISTS fare_daily_totals (
+            srcode TEXT NOT NULL REFERENCES users(srcode) ON DELETE CASCADE,
+            day TEXT NOT NULL,
+            total_fare REAL NOT NULL,
+            trips INTEGER NOT NULL,
+            PRIMARY KEY (srcode, day)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (2, [
+        # Idempotency keys let the fare journal resend a batch safely
+        "ALTER TABLE fare_history ADD COLUMN client_key TEXT",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_fare_history_client_key ON fare_history (client_key)",
+    ]),
+]
+
+def to_sql_value(value):
+    """Turn dates and datetimes into the text form they are stored as"""
+    if isinstance(value, datetime):
+        return value.strftime(TIMESTAMP_FORMAT)
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def fare_row(row):
+    """Convert a fare_history row to a dict with created_date as a datetime"""
+    record = dict(row)
+    if record.get('created_date'):
+        record['created_date'] = datetime.strptime(record['created_date'], TIMESTAMP_FORMAT)
+    return record
+
+class SQLiteStorage(Storage):
+    """Storage backend for an embedded SQLite database file
+    
+    Each thread gets its own connection. The database runs in WAL mode so
+    the UI's reads are never blocked by the background writer.
+    """
+    
+    name = 'sqlite'
+    Error = sqlite3.Error
+    PermanentError = (sqlite3.IntegrityError, sqlite3.DataError)
+    
+    def __init__(self, path, busy_timeout=10):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+    
+    def connection(self):
+        """Return this thread's connection, opening it on first use"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            with timer('db.open_connection'):
+                # isolation_level=None leaves transactions to transaction() below
+                connection = sqlite3.connect(
+                    self.path, timeout=self.busy_timeout, isolation_level=None,
+                    check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE
+                )
+                connection.row_factory = sqlite3.Row
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.execute("PRAGMA synchronous = NORMAL")
+                connection.execute("PRAGMA foreign_keys = ON")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+    
+    @contextmanager
+    def transaction(self):
+        """Run the block as one write transaction, rolling back on error"""
+        connection = self.connection()
+        # IMMEDIATE takes the write lock up front so reads inside see a stable snapshot
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def initialize(self):
+        try:
+            connection = self.connection()
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            for schema_version, statements in SCHEMA:
+                if schema_version <= version:
+                    continue
+                with self.transaction() as connection:
+                    for statement in statements:
+                        connection.execute(statement)
+                    connection.execute(f"PRAGMA user_version = {schema_version}")
+                print(f"Applied SQLite schema version {schema_version}")
+            return True
+        except sqlite3.Error as e:
+            print(f"Error initializing SQLite database '{self.path}': {e}")
+            return False
+    
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+    
+    def create_user(self, srcode, name, password, college):
+        with self.transaction() as connection:
+            connection.execute("""
+                INSERT INTO users (srcode, name, password, college)
+                VALUES (?, ?, ?, ?)
+            """, (srcode, name, password, college))
+    
+    def get_user(self, srcode):
+        row = self.connection().execute("SELECT * FROM users WHERE srcode = ?", (srcode,)).fetchone()
+        return dict(row) if row else None
+    
+    def update_college(self, srcode, new_college):
+        with self.transaction() as connection:
+            connection.execute("UPDATE users SET college = ? WHERE srcode = ?", (new_college, srcode))
+    
+    def save_fare_records(self, records, keys=None, created=None):
+        # History rows and rollups use the same timestamps, so they agree on the day
+        created = creation_times(records, created)
+        with self.transaction() as connection:
+            if keys:
+                # Skip records a previous attempt already committed
+                placeholders = ', '.join(['?'] * len(keys))
+                rows = connection.execute(f"SELECT client_key FROM fare_history WHERE client_key IN ({placeholders})", list(keys))
+                records, keys, created = unsaved(records, keys, created, {row[0] for row in rows})
+                if not records:
+                    return 0
+            else:
+                keys = [None] * len(records)
+            
+            connection.executemany("""
+                INSERT INTO fare_history (srcode, district, start_location, destination, include_trike, total_fare, client_key, created_date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [record + (key, stamp) for record, key, stamp in zip(records, keys, created)])
+            connection.executemany("""
+                INSERT INTO fare_daily_totals (srcode, day, total_fare, trips)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (srcode, day) DO UPDATE
+                SET total_fare = total_fare + excluded.total_fare, trips = trips + excluded.trips
+            """, daily_totals(records, created))
+        return len(records)
+    
+    def get_user_fares(self, srcode):
+        rows = self.connection().execute("""
+            SELECT * FROM fare_history
+            WHERE srcode = ?
+            ORDER BY created_date DESC, id DESC
+        """, (srcode,)).fetchall()
+        return [fare_row(row) for row in rows]
+    
+    def get_user_fares_page(self, srcode, limit, after=None):
+        connection = self.connection()
+        if after is None:
+            rows = connection.execute(f"""
+                SELECT {FARE_COLUMNS} FROM fare_history
+                WHERE srcode = ?
+                ORDER BY created_date DESC, id DESC
+                LIMIT ?
+            """, (srcode, limit)).fetchall()
+        else:
+            last_date, last_id = after
+            last_date = to_sql_value(last_date)
+            rows = connection.execute(f"""
+                SELECT {FARE_COLUMNS} FROM fare_history
+                WHERE srcode = ?
+                  AND (created_date < ? OR (created_date = ? AND id < ?))
+                ORDER BY created_date DESC, id DESC
+                LIMIT ?
+            """, (srcode, last_date, last_date, last_id, limit)).fetchall()
+        return [fare_row(row) for row in rows]
+    
+    def count_user_fares(self, srcode):
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM fare_history WHERE srcode = ?", (srcode,)
+        ).fetchone()[0]
+    
+    def delete_fare_record(self, record_id):
+        with self.transaction() as connection:
+            row = connection.execute("""
+                SELECT srcode, date(created_date), total_fare FROM fare_history WHERE id = ?
+            """, (record_id,)).fetchone()
+            connection.execute("DELETE FROM fare_history WHERE id = ?", (record_id,))
+            
+            # Take the record back out of its day's rollup
+            if row:
+                srcode, day, total_fare = row
+                connection.execute("""
+                    UPDATE fare_daily_totals SET total_fare = total_fare - ?, trips = trips - 1
+                    WHERE srcode = ? AND day = ?
+                """, (total_fare, srcode, day))
+                connection.execute("""
+                    DELETE FROM fare_daily_totals WHERE srcode = ? AND day = ? AND trips <= 0
+                """, (srcode, day))
+    
+    def get_fare_rows(self, srcode=None, college=None):
+        # strftime('%s') reads the local-time text as if it were UTC, which
+        # gives the wall-clock seconds analytics expects
+        select = """
+            SELECT CAST(strftime('%s', f.created_date) AS INTEGER), f.total_fare,
+                   f.district, f.start_location, f.destination, f.include_trike
+            FROM fare_history f
+        """
+        if srcode:
+            query = select + " WHERE f.srcode = ? ORDER BY f.created_date"
+            params = (srcode,)
+        else:
+            query = select + " JOIN users u ON u.srcode = f.srcode WHERE u.college = ? ORDER BY f.created_date"
+            params = (college,)
+        return [tuple(row) for row in self.connection().execute(query, params)]
+    
+    def get_fare_totals(self, srcode, days):
+        return self.connection().execute("""
+            SELECT COALESCE(SUM(total_fare), 0), COALESCE(SUM(trips), 0)
+            FROM fare_daily_totals
+            WHERE srcode = ? AND day >= date('now', 'localtime', ?)
+        """, (srcode, f"-{days - 1} days")).fetchone()
+    
+    def get_fare_totals_between(self, srcode, start_day, end_day):
+        return self.connection().execute("""
+            SELECT COALESCE(SUM(total_fare), 0), COALESCE(SUM(trips), 0)
+            FROM fare_daily_totals
+            WHERE srcode = ? AND day BETWEEN ? AND ?
+        """, (srcode, to_sql_value(start_day), to_sql_value(end_day))).fetchone()
+    
+    def rebuild_daily_totals(self, srcode=None):
+        where = "WHERE srcode = ?" if srcode else ""
+        params = (srcode,) if srcode else ()
+        with self.transaction() as connection:
+            connection.execute(f"DELETE FROM fare_daily_totals {where}", params)
+            connection.execute(f"""
+                INSERT INTO fare_daily_totals (srcode, day, total_fare, trips)
+                SELECT srcode, date(created_date), SUM(total_fare), COUNT(*)
+                FROM fare_history {where}
+                GROUP BY srcode, date(created_date)
+            """, params)
@@ -0,0 +1,147 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import database
+import fare_journal
+from fare_journal import FareJournal, JournalSync, replay
+
+def save_entry(key, srcode='21-00001', fare=25.0, created='2026-01-05 08:30:00'):
+    """A journaled fare save as queue_fare_record() writes it"""
+    return {
+        'op': 'save',
+        'key': key,
+        'created': created,
+        'record': [srcode, 1, 'balayan', 'bsu', 'n', fare]
+    }
+
+class ReplayTest(unittest.TestCase):
+    """replay() against a throwaway SQLite database"""
+    
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.saved_backend = database.DB_BACKEND
+        self.saved_config = dict(database.SQLITE_CONFIG)
+        database.close_storage()
+        database.DB_BACKEND = 'sqlite'
+        database.SQLITE_CONFIG['path'] = os.path.join(self.workdir, 'faretracker.db')
+        self.assertTrue(database.initialize_database())
+        self.assertTrue(database.create_user('21-00001', 'Test User', 'secret', 'CICS'))
+        self.rejected = []
+    
+    def tearDown(self):
+        database.close_storage()
+        database.DB_BACKEND = self.saved_backend
+        database.SQLITE_CONFIG.clear()
+        database.SQLITE_CONFIG.update(self.saved_config)
+        shutil.rmtree(self.workdir)
+    
+    def reject(self, entry, reason):
+        self.rejected.append((entry, reason))
+    
+    def rows(self):
+        connection = database.get_storage().connection()
+        return connection.execute(
+            "SELECT client_key, created_date, total_fare FROM fare_history ORDER BY id").fetchall()
+    
+    def rollups(self):
+        connection = database.get_storage().connection()
+        return connection.execute(
+            "SELECT srcode, day, total_fare, trips FROM fare_daily_totals ORDER BY day").fetchall()
+    
+    def test_saves_keep_the_journaled_time(self):
+        entries = [save_entry('a', created='2026-01-05 08:30:00'),
+                   save_entry('b', fare=30.0, created='2026-01-06 17:45:10')]
+        self.assertEqual(replay(entries, self.reject), 2)
+        
+        self.assertEqual([tuple(row) for row in self.rows()],
+                         [('a', '2026-01-05 08:30:00', 25.0), ('b', '2026-01-06 17:45:10', 30.0)])
+        self.assertEqual([tuple(row) for row in self.rollups()],
+                         [('21-00001', '2026-01-05', 25.0, 1), ('21-00001', '2026-01-06', 30.0, 1)])
+        self.assertEqual(self.rejected, [])
+    
+    def test_entries_without_a_time_are_stamped_at_sync(self):
+        entry = save_entry('a')
+        del entry['created']
+        self.assertEqual(replay([entry], self.reject), 1)
+        self.assertEqual(len(self.rows()), 1)
+        self.assertEqual(self.rows()[0][1][:10], self.rollups()[0][1])
+    
+    def test_resend_is_idempotent(self):
+        entries = [save_entry('a'), save_entry('b', fare=30.0)]
+        self.assertEqual(replay(entries, self.reject), 2)
+        # As if the commit landed but the journal was not trimmed before a crash
+        self.assertEqual(replay(entries, self.reject), 2)
+        
+        self.assertEqual([row[0] for row in self.rows()], ['a', 'b'])
+        self.assertEqual([tuple(row) for row in self.rollups()], [('21-00001', '2026-01-05', 55.0, 2)])
+    
+    def test_save_fare_records_counts_inserted_rows(self):
+        records = [('21-00001', 1, 'balayan', 'bsu', 'n', 25.0), ('21-00001', 1, 'bsu', 'balayan', 'n', 25.0)]
+        self.assertEqual(database.save_fare_records(records, ['a', 'b']), 2)
+        self.assertEqual(database.save_fare_records(records, ['a', 'b']), 0)
+        self.assertEqual(database.save_fare_records(records, ['b', 'c']), 1)
+        self.assertEqual(database.save_fare_records(records), 2)
+    
+    def test_refused_entries_are_rejected_and_the_rest_saved(self):
+        entries = [
+            save_entry('a'),
+            save_entry('b', srcode='no-such-user'),    # Foreign key violation
+            {'op': 'save', 'key': 'c', 'record': ['21-00001']},
+            {'op': 'rename'},
+            save_entry('d', created='yesterday'),
+            save_entry('e', fare=40.0)
+        ]
+        self.assertEqual(replay(entries, self.reject), len(entries))
+        
+        self.assertEqual([row[0] for row in self.rows()], ['a', 'e'])
+        self.assertEqual([entry.get('key') for entry, _ in self.rejected], ['b', 'c', None, 'd'])
+    
+    def test_transient_error_stops_replay(self):
+        storage = database.get_storage()
+        real_save = storage.save_fare_records
+        
+        def locked(records, keys=None, created=None):
+            raise sqlite3.OperationalError("database is locked")
+        storage.save_fare_records = locked
+        try:
+            self.assertEqual(replay([save_entry('a'), save_entry('b')], self.reject), 0)
+        finally:
+            storage.save_fare_records = real_save
+        
+        self.assertEqual(self.rows(), [])
+        self.assertEqual(self.rejected, [])
+    
+    def test_sync_keeps_pending_entries_until_they_are_saved(self):
+        journal = FareJournal(os.path.join(self.workdir, 'fare_journal.jsonl'))
+        # A long flush interval so only the explicit sync() calls below run
+        sync = JournalSync(journal, batch_size=50, flush_interval=3600, retry_initial=1, retry_max=1)
+        storage = database.get_storage()
+        real_save = storage.save_fare_records
+        try:
+            journal.append(save_entry('a'))
+            journal.append(save_entry('b'))
+            
+            def locked(records, keys=None, created=None):
+                raise sqlite3.OperationalError("database is locked")
+            storage.save_fare_records = locked
+            self.assertFalse(sync.sync())
+            self.assertEqual(journal.pending_count(), 2)
+            
+            storage.save_fare_records = real_save
+            self.assertTrue(sync.sync())
+            self.assertEqual(journal.pending_count(), 0)
+            self.assertEqual([row[0] for row in self.rows()], ['a', 'b'])
+        finally:
+            storage.save_fare_records = real_save
+            sync.stop()
+    
+    def test_reject_entry_writes_the_rejected_file(self):
+        path = os.path.join(self.workdir, fare_journal.REJECTED_FILE)
+        fare_journal.reject_entry({'op': 'rename'}, "unknown op 'rename'", path)
+        with open(path, encoding='utf-8') as f:
+            self.assertIn("unknown op", f.read())
+
+if __name__ == '__main__':
+    unittest.main()
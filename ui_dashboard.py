@@ -1,17 +1,42 @@
+import time
 import tkinter as tk
-from tkinter import ttk, messagebox
-from database import get_user, get_user_fares, delete_fare_record, update_college, get_weekly_average
-from session import load_session
+from tkinter import messagebox
+from datetime import date, datetime, timedelta
+from database import get_user, delete_fare_record, update_college, get_weekly_totals, count_user_fares, get_fare_columns
+from fare_journal import flush_fare_queue, queue_fare_delete, change_count
+import fare_calculator
+from fare_calculator import load_fare_guide
+from async_db import run_async
+from ui_history import HistoryTable
+
+# Reload the dashboard when it is shown after being left alone this long (seconds)
+STALE_AFTER_SECONDS = 300
 
 class DashboardPage:
-    def __init__(self, parent, navigate_callback):
+    def __init__(self, parent, navigate_callback, sessions):
         self.parent = parent
         self.navigate_callback = navigate_callback
+        self.sessions = sessions
         self.frame = tk.Frame(parent, bg='#f0f0f0')
         self.user_data = None
         
+        # Last 7 days totals, kept current by deltas after deletes
+        self.weekly_total = 0.0
+        self.weekly_count = 0
+        
+        # What the shown data was loaded for, so on_show() can tell when it is stale
+        self.loaded_srcode = None
+        self.loaded_changes = None
+        self.loaded_at = 0.0
+        
         self.create_widgets()
-        self.load_data()
+    
+    def on_show(self):
+        """Reload when the user, their saved trips or the date may have changed"""
+        if (self.loaded_srcode != self.sessions.current_srcode()
+                or self.loaded_changes != change_count()
+                or time.monotonic() - self.loaded_at > STALE_AFTER_SECONDS):
+            self.load_data()
     
     def create_widgets(self):
         """Create all widgets for the Dashboard page"""
@@ -119,7 +144,7 @@ class DashboardPage:
             padx=15,
             pady=15
         )
-        self.weekly_avg_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0))
+        self.weekly_avg_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=10)
         
         self.avg_label = tk.Label(
             self.weekly_avg_frame,
@@ -131,6 +156,29 @@ class DashboardPage:
         )
         self.avg_label.pack(expand=True)
         
+        # Spending Summary Box (far right)
+        self.summary_frame = tk.LabelFrame(
+            boxes_container,
+            text="Spending Summary",
+            font=('Arial', 12, 'bold'),
+            bg='#ffffff',
+            fg='#333',
+            padx=15,
+            pady=15
+        )
+        self.summary_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0))
+        
+        self.summary_label = tk.Label(
+            self.summary_frame,
+            text="-",
+            font=('Arial', 9),
+            bg='#ffffff',
+            fg='#333',
+            justify=tk.LEFT,
+            anchor='nw'
+        )
+        self.summary_label.pack(fill=tk.BOTH, expand=True)
+        
         # History Section
         history_frame = tk.LabelFrame(
             self.frame,
@@ -156,34 +204,8 @@ class DashboardPage:
         )
         refresh_btn.pack(anchor=tk.E, pady=(0, 10))
         
-        # Treeview for history table
-        columns = ('Date', 'District', 'Start', 'Destination', 'Trike', 'Total Fare', 'ID')
-        self.history_tree = ttk.Treeview(history_frame, columns=columns, show='headings', height=10)
-        
-        # Configure column headings
-        self.history_tree.heading('Date', text='Date')
-        self.history_tree.heading('District', text='District')
-        self.history_tree.heading('Start', text='Start Location')
-        self.history_tree.heading('Destination', text='Destination')
-        self.history_tree.heading('Trike', text='Trike')
-        self.history_tree.heading('Total Fare', text='Total Fare')
-        self.history_tree.heading('ID', text='ID')
-        
-        # Configure column widths
-        self.history_tree.column('Date', width=150)
-        self.history_tree.column('District', width=80)
-        self.history_tree.column('Start', width=150)
-        self.history_tree.column('Destination', width=150)
-        self.history_tree.column('Trike', width=60)
-        self.history_tree.column('Total Fare', width=100)
-        self.history_tree.column('ID', width=50)
-        
-        # Scrollbar for treeview
-        scrollbar = ttk.Scrollbar(history_frame, orient=tk.VERTICAL, command=self.history_tree.yview)
-        self.history_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.history_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Virtualized table that pages records in as the user scrolls
+        self.history_table = HistoryTable(history_frame, height=10)
         
         # Delete button
         delete_btn = tk.Button(
@@ -200,62 +222,119 @@ class DashboardPage:
     
     def load_data(self):
         """Load user data and fare history"""
-        srcode = load_session()
-        if not srcode:
+        session = self.sessions.current
+        if not session:
             messagebox.showerror("Error", "Please login first")
             self.navigate_callback("logout")
             return
         
+        # Show loading state while the queries run in the background
+        srcode = session.srcode
+        self.loaded_srcode = srcode
+        self.loaded_changes = change_count()
+        self.loaded_at = time.monotonic()
+        self.avg_label.config(text="Average Fare (Last 7 Days):\nLoading...")
+        self.history_table.reload(srcode)
+        run_async(
+            self.frame,
+            self.fetch_data,
+            session,
+            on_success=self.show_data,
+            on_error=lambda error: messagebox.showerror("Error", "Could not load user data")
+        )
+        self.load_summary(srcode)
+    
+    def fetch_data(self, session):
+        """Fetch everything the dashboard shows (runs on a worker thread)"""
+        # Make sure trips saved moments ago are counted
+        flush_fare_queue()
+        
+        # The session keeps the user row after the first fetch
+        if session.user is None:
+            session.user = get_user(session.srcode)
+        if not session.user:
+            return None, (0.0, 0)
+        return session.user, get_weekly_totals(session.srcode)
+    
+    def show_data(self, result):
+        """Populate the dashboard with fetched data"""
+        user_data, (self.weekly_total, self.weekly_count) = result
+        
         # Load user data
-        self.user_data = get_user(srcode)
+        self.user_data = user_data
         if self.user_data:
             self.srcode_label.config(text=f"SRCODE: {self.user_data.get('srcode', '-')}")
             self.name_label.config(text=f"Name: {self.user_data.get('name', '-')}")
             self.college_label.config(text=self.user_data.get('college', '-'))
         else:
+            self.avg_label.config(text="Average Fare (Last 7 Days):\n₱0.00")
             messagebox.showerror("Error", "Could not load user data")
             return
         
         # Load weekly average
-        avg_fare = get_weekly_average(srcode)
+        self.show_weekly_average()
+    
+    def show_weekly_average(self):
+        """Show the average of the cached weekly totals"""
+        avg_fare = self.weekly_total / self.weekly_count if self.weekly_count else 0.0
         self.avg_label.config(text=f"Average Fare (Last 7 Days):\n₱{avg_fare:.2f}")
+    
+    def refresh_weekly_average(self, srcode):
+        """Refetch only the weekly totals"""
+        run_async(self.frame, get_weekly_totals, srcode, on_success=self.weekly_totals_loaded)
+    
+    def weekly_totals_loaded(self, totals):
+        """Show freshly fetched weekly totals"""
+        self.weekly_total, self.weekly_count = totals
+        self.show_weekly_average()
+    
+    def load_summary(self, srcode):
+        """Compute the spending summary in the background"""
+        self.summary_label.config(text="Loading...")
+        run_async(
+            self.frame,
+            self.fetch_summary,
+            srcode,
+            on_success=self.show_summary,
+            on_error=lambda error: self.summary_label.config(text="Summary unavailable")
+        )
+    
+    def fetch_summary(self, srcode):
+        """Fetch the user's history as columns and summarize it (runs on a worker thread)"""
+        from analytics import summarize    # Pulls in numpy, so it is imported on first use
+        if not fare_calculator.fare_guide:
+            load_fare_guide()  # Needed to split spend by transport type
+        return summarize(get_fare_columns(srcode=srcode))
+    
+    def show_summary(self, summary):
+        """Show the spending summary"""
+        if not summary['trips']:
+            self.summary_label.config(text="No trips recorded yet")
+            return
         
-        # Load fare history
-        self.load_history()
+        lines = [f"Total: ₱{summary['total']:.2f} ({summary['trips']} trips)"]
+        month, total = summary['this_month']
+        lines.append(f"This month ({month}): ₱{total:.2f}")
+        if summary['moving_average']:
+            lines.append(f"7-day avg per day: ₱{summary['moving_average'][-1][1]:.2f}")
+        percentiles = summary['percentiles']
+        lines.append(f"Median trip: ₱{percentiles[50]:.2f}, 90th pct: ₱{percentiles[90]:.2f}")
+        if summary['by_route']:
+            route, total, trips = summary['by_route'][0]
+            lines.append(f"Top route: {route} (₱{total:.2f})")
+        if summary['by_transport']:
+            lines.append("By transport: " + ", ".join(
+                f"{transport} ₱{total:.0f}" for transport, total in summary['by_transport'][:3]
+            ))
+        self.summary_label.config(text="\n".join(lines))
     
     def load_history(self):
         """Load fare history into treeview"""
-        # Clear existing items
-        for item in self.history_tree.get_children():
-            self.history_tree.delete(item)
-        
-        srcode = load_session()
+        srcode = self.sessions.current_srcode()
         if not srcode:
             return
         
-        fares = get_user_fares(srcode)
-        for fare in fares:
-            # Format date
-            try:
-                if fare.get('created_date'):
-                    if hasattr(fare['created_date'], 'strftime'):
-                        date_str = fare['created_date'].strftime('%Y-%m-%d %H:%M')
-                    else:
-                        date_str = str(fare['created_date'])
-                else:
-                    date_str = '-'
-            except Exception:
-                date_str = '-'
-            
-            self.history_tree.insert('', tk.END, values=(
-                date_str,
-                fare.get('district', '-'),
-                fare.get('start_location', '-'),
-                fare.get('destination', '-'),
-                fare.get('include_trike', '-'),
-                f"₱{fare.get('total_fare', 0.0):.2f}",
-                fare.get('id', '-')
-            ))
+        self.history_table.reload(srcode)
     
     def update_college(self):
         """Update user's college"""
@@ -264,37 +343,98 @@ class DashboardPage:
             messagebox.showerror("Error", "Please enter a college name")
             return
         
-        srcode = load_session()
+        srcode = self.sessions.current_srcode()
         if not srcode:
             messagebox.showerror("Error", "Please login first")
             self.navigate_callback("logout")
             return
         
-        if update_college(srcode, new_college):
+        run_async(
+            self.frame,
+            update_college,
+            srcode,
+            new_college,
+            on_success=lambda updated: self.finish_update_college(updated, new_college),
+            on_error=lambda error: self.finish_update_college(False, new_college)
+        )
+    
+    def finish_update_college(self, updated, new_college):
+        """Handle the result of a background college update"""
+        if updated:
             messagebox.showinfo("Success", "College updated successfully!")
             self.college_entry.delete(0, tk.END)
-            self.load_data()  # Refresh data
+            
+            # Only the college changed, so update it in place (this is also the session's cached row)
+            if self.user_data:
+                self.user_data['college'] = new_college
+            self.college_label.config(text=new_college)
         else:
             messagebox.showerror("Error", "Failed to update college")
     
     def delete_record(self):
         """Delete selected fare record"""
-        selected = self.history_tree.selection()
-        if not selected:
+        record_id = self.history_table.selected_record_id()
+        if record_id is None:
             messagebox.showwarning("Warning", "Please select a record to delete")
             return
         
-        # Get record ID from selected item
-        item = self.history_tree.item(selected[0])
-        record_id = item['values'][6]  # ID is in the last column
+        srcode = self.sessions.current_srcode()
+        if not srcode:
+            messagebox.showerror("Error", "Please login first")
+            self.navigate_callback("logout")
+            return
         
         # Confirm deletion
         if messagebox.askyesno("Confirm", "Are you sure you want to delete this record?"):
-            if delete_fare_record(record_id):
-                messagebox.showinfo("Success", "Record deleted successfully!")
-                self.load_history()  # Refresh history
-            else:
-                messagebox.showerror("Error", "Failed to delete record")
+            fare = self.history_table.find_record(record_id)
+            expected_count = self.history_table.total - 1
+            run_async(
+                self.frame,
+                self.delete_and_count,
+                record_id,
+                srcode,
+                on_success=lambda result: self.finish_delete(record_id, fare, expected_count, result),
+                on_error=lambda error: self.finish_delete(record_id, fare, expected_count, (False, None))
+            )
+    
+    def delete_and_count(self, record_id, srcode):
+        """Delete a record and recount the history (runs on a worker thread)
+        
+        If the database cannot be reached the delete is journaled instead and
+        the count comes back as None.
+        """
+        if not delete_fare_record(record_id):
+            return queue_fare_delete(record_id), None
+        return True, count_user_fares(srcode)
+    
+    def finish_delete(self, record_id, fare, expected_count, result):
+        """Apply a successful delete to the table and weekly average"""
+        deleted, count = result
+        if not deleted:
+            messagebox.showerror("Error", "Failed to delete record")
+            return
+        
+        if count is None:
+            messagebox.showinfo("Success", "Record deleted. The change will be saved once the database is reachable.")
+        else:
+            messagebox.showinfo("Success", "Record deleted successfully!")
+        
+        # Someone else changed this history meanwhile; start over
+        if (count is not None and count != expected_count) or fare is None:
+            self.load_data()
+            return
+        
+        self.history_table.remove_record(record_id)
+        
+        created_date = fare.get('created_date')
+        if isinstance(created_date, datetime):
+            # The weekly totals cover today and the 6 days before it
+            if created_date.date() >= date.today() - timedelta(days=6):
+                self.weekly_total -= float(fare.get('total_fare', 0.0))
+                self.weekly_count = max(0, self.weekly_count - 1)
+                self.show_weekly_average()
+        else:
+            self.refresh_weekly_average(self.sessions.current_srcode())
     
     def get_frame(self):
         """Return the frame widget"""
@@ -0,0 +1,114 @@
+import tkinter as tk
+from tkinter import ttk, filedialog, messagebox
+import instrumentation
+
+# How often the open panel refreshes its numbers
+REFRESH_MS = 1000
+
+def format_ms(seconds):
+    """Format a duration in seconds as milliseconds for the table"""
+    return f"{seconds * 1000:.3f}"
+
+class DebugPanel:
+    """Window showing call latencies, counters and cache stats, with profiling and export"""
+    
+    def __init__(self, root):
+        self.window = tk.Toplevel(root)
+        self.window.title("Fare Tracker - Debug")
+        self.window.geometry("820x560")
+        self.window.configure(bg='#f0f0f0')
+        
+        self.create_widgets()
+        self.refresh()
+    
+    def create_widgets(self):
+        """Create the metrics table, buttons and text area"""
+        # Buttons
+        buttons = tk.Frame(self.window, bg='#f0f0f0')
+        buttons.pack(fill=tk.X, padx=10, pady=10)
+        
+        self.profile_btn = tk.Button(buttons, text="Start Profiling", font=('Arial', 10), command=self.toggle_profiling)
+        self.profile_btn.pack(side=tk.LEFT, padx=2)
+        tk.Button(buttons, text="Reset", font=('Arial', 10), command=self.reset).pack(side=tk.LEFT, padx=2)
+        tk.Button(buttons, text="Export JSON...", font=('Arial', 10), command=self.export_json).pack(side=tk.LEFT, padx=2)
+        tk.Button(buttons, text="Export Prometheus...", font=('Arial', 10), command=self.export_prometheus).pack(side=tk.LEFT, padx=2)
+        
+        # Timings table
+        columns = ('Call', 'Count', 'Errors', 'Mean', 'p50', 'p95', 'p99', 'Max')
+        self.tree = ttk.Treeview(self.window, columns=columns, show='headings', height=12)
+        for column in columns:
+            self.tree.heading(column, text=column if column in ('Call', 'Count', 'Errors') else f"{column} (ms)")
+            self.tree.column(column, width=240 if column == 'Call' else 75, anchor='w' if column == 'Call' else 'e')
+        self.tree.pack(fill=tk.BOTH, expand=True, padx=10)
+        
+        # Counters, cache stats and the profile report
+        self.text = tk.Text(self.window, font=('Courier', 9), height=14, wrap=tk.NONE)
+        self.text.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        self.profile_text = None
+    
+    def refresh(self):
+        """Redraw the table and text from the current numbers"""
+        if not self.window.winfo_exists():
+            return
+        data = instrumentation.snapshot()
+        
+        self.tree.delete(*self.tree.get_children())
+        for name, stats in data['timings'].items():
+            if stats['count']:
+                self.tree.insert('', tk.END, values=(
+                    name, stats['count'], stats['errors'], format_ms(stats['mean']),
+                    format_ms(stats['p50']), format_ms(stats['p95']), format_ms(stats['p99']), format_ms(stats['max'])
+                ))
+        
+        lines = ["Counters:"]
+        lines += [f"  {name}: {value}" for name, value in data['counters'].items()] or ["  (none)"]
+        for group, values in data['gauges'].items():
+            lines.append(f"{group}: " + ", ".join(f"{key}={value}" for key, value in values.items()))
+        if instrumentation.is_profiling():
+            lines += ["", "Profiling... press Stop Profiling to see the report."]
+        elif self.profile_text:
+            lines += ["", self.profile_text]
+        
+        self.text.config(state=tk.NORMAL)
+        self.text.delete('1.0', tk.END)
+        self.text.insert('1.0', "\n".join(lines))
+        self.text.config(state=tk.DISABLED)
+        
+        self.window.after(REFRESH_MS, self.refresh)
+    
+    def toggle_profiling(self):
+        """Start or stop a cProfile capture of the instrumented calls"""
+        if instrumentation.is_profiling():
+            self.profile_text = instrumentation.stop_profiling()
+            self.profile_btn.config(text="Start Profiling")
+        else:
+            instrumentation.start_profiling()
+            self.profile_btn.config(text="Stop Profiling")
+    
+    def reset(self):
+        """Clear timings and counters"""
+        instrumentation.reset()
+        self.profile_text = None
+    
+    def export_json(self):
+        """Save the numbers as JSON"""
+        self.export(instrumentation.export_json, '.json', [("JSON", "*.json")])
+    
+    def export_prometheus(self):
+        """Save the numbers in the Prometheus text format"""
+        self.export(instrumentation.prometheus_text, '.prom', [("Prometheus text", "*.prom"), ("Text", "*.txt")])
+    
+    def export(self, write, extension, filetypes):
+        """Ask for a file name and write the export to it"""
+        path = filedialog.asksaveasfilename(parent=self.window, defaultextension=extension, filetypes=filetypes)
+        if not path:
+            return
+        try:
+            write(path)
+        except OSError as e:
+            messagebox.showerror("Error", f"Could not save {path}: {e}", parent=self.window)
+    
+    def focus(self):
+        """Bring the window to the front"""
+        self.window.deiconify()
+        self.window.lift()
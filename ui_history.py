@@ -0,0 +1,292 @@
+import tkinter as tk
+from tkinter import ttk
+from database import get_user_fares_page, count_user_fares
+from fare_journal import flush_fare_queue
+from async_db import run_async
+
+# Rows fetched per query
+PAGE_SIZE = 50
+
+# Extra rows kept loaded below the visible window so scrolling rarely waits
+PREFETCH_ROWS = 50
+
+def format_fare_row(fare):
+    """Turn a fare record into Treeview values"""
+    try:
+        if fare.get('created_date'):
+            if hasattr(fare['created_date'], 'strftime'):
+                date_str = fare['created_date'].strftime('%Y-%m-%d %H:%M')
+            else:
+                date_str = str(fare['created_date'])
+        else:
+            date_str = '-'
+    except Exception:
+        date_str = '-'
+    
+    return (
+        date_str,
+        fare.get('district', '-'),
+        fare.get('start_location', '-'),
+        fare.get('destination', '-'),
+        fare.get('include_trike', '-'),
+        f"₱{fare.get('total_fare', 0.0):.2f}",
+        fare.get('id', '-')
+    )
+
+class HistoryTable:
+    """Fare history Treeview that only renders the rows currently in view
+    
+    Records are fetched page by page (keyset pagination) as the user scrolls,
+    and the Treeview only ever holds `height` items whose values are swapped
+    as the window moves.
+    """
+    
+    def __init__(self, parent, height=10):
+        self.height = height
+        self.srcode = None
+        self.records = []          # Fetched records, newest first
+        self.formatted = []        # Treeview values for each fetched record
+        self.total = 0
+        self.offset = 0            # Index of the first visible record
+        self.has_more = False
+        self.fetching = False
+        self.generation = 0        # Bumped on reload so stale pages are dropped
+        self.selected_id = None    # Record ID kept selected across scrolling
+        
+        container = tk.Frame(parent, bg='#ffffff')
+        container.pack(fill=tk.BOTH, expand=True)
+        
+        # Treeview for history table
+        columns = ('Date', 'District', 'Start', 'Destination', 'Trike', 'Total Fare', 'ID')
+        self.tree = ttk.Treeview(container, columns=columns, show='headings', height=height)
+        
+        # Configure column headings
+        self.tree.heading('Date', text='Date')
+        self.tree.heading('District', text='District')
+        self.tree.heading('Start', text='Start Location')
+        self.tree.heading('Destination', text='Destination')
+        self.tree.heading('Trike', text='Trike')
+        self.tree.heading('Total Fare', text='Total Fare')
+        self.tree.heading('ID', text='ID')
+        
+        # Configure column widths
+        self.tree.column('Date', width=150)
+        self.tree.column('District', width=80)
+        self.tree.column('Start', width=150)
+        self.tree.column('Destination', width=150)
+        self.tree.column('Trike', width=60)
+        self.tree.column('Total Fare', width=100)
+        self.tree.column('ID', width=50)
+        
+        # The scrollbar tracks our window over all records, not the Treeview itself
+        self.scrollbar = ttk.Scrollbar(container, orient=tk.VERTICAL, command=self.on_scrollbar)
+        
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.tree.bind('<MouseWheel>', self.on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self.scroll_to(self.offset - 3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_to(self.offset + 3))
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<Up>', self.on_key_up)
+        self.tree.bind('<Down>', self.on_key_down)
+    
+    def reload(self, srcode):
+        """Drop all cached rows and fetch the first page again"""
+        self.generation += 1
+        self.srcode = srcode
+        self.records = []
+        self.formatted = []
+        self.total = 0
+        self.offset = 0
+        self.has_more = True
+        self.fetching = False
+        self.selected_id = None
+        self.show_loading()
+        
+        run_async(
+            self.tree,
+            self.fetch_first_page,
+            srcode,
+            on_success=lambda result, g=self.generation: self.first_page_loaded(g, result)
+        )
+    
+    def fetch_first_page(self, srcode):
+        """Fetch the record count and first page (runs on a worker thread)"""
+        # Make sure trips saved moments ago show up
+        flush_fare_queue()
+        return count_user_fares(srcode), get_user_fares_page(srcode, PAGE_SIZE)
+    
+    def first_page_loaded(self, generation, result):
+        """Show the first page once it arrives"""
+        if generation != self.generation:
+            return
+        total, page = result
+        self.total = total
+        self.add_page(page)
+        self.render()
+        self.ensure_loaded()
+    
+    def add_page(self, page):
+        """Append a fetched page to the cache"""
+        self.records.extend(page)
+        self.formatted.extend(format_fare_row(fare) for fare in page)
+        if len(page) < PAGE_SIZE:
+            self.has_more = False
+            self.total = len(self.records)
+        else:
+            self.total = max(self.total, len(self.records))
+    
+    def ensure_loaded(self):
+        """Fetch the next page if the window plus prefetch margin is not loaded yet"""
+        needed = self.offset + self.height + PREFETCH_ROWS
+        if self.fetching or not self.has_more or len(self.records) >= needed:
+            return
+        
+        last = self.records[-1] if self.records else None
+        after = (last['created_date'], last['id']) if last else None
+        self.fetching = True
+        run_async(
+            self.tree,
+            get_user_fares_page,
+            self.srcode,
+            PAGE_SIZE,
+            after,
+            on_success=lambda page, g=self.generation: self.next_page_loaded(g, page),
+            on_error=lambda error, g=self.generation: self.next_page_failed(g)
+        )
+    
+    def next_page_loaded(self, generation, page):
+        """Add a page fetched while scrolling"""
+        if generation != self.generation:
+            return
+        self.fetching = False
+        self.add_page(page)
+        self.render()
+        self.ensure_loaded()
+    
+    def next_page_failed(self, generation):
+        """Stop paging after a failed fetch; the next reload will retry"""
+        if generation != self.generation:
+            return
+        self.fetching = False
+        self.has_more = False
+    
+    def show_loading(self):
+        """Replace the rows with a loading placeholder"""
+        self.tree.delete(*self.tree.get_children())
+        self.tree.insert('', tk.END, iid='loading', values=('Loading...', '', '', '', '', '', ''))
+        self.scrollbar.set(0.0, 1.0)
+    
+    def render(self):
+        """Show the loaded records that fall inside the current window"""
+        if self.tree.exists('loading'):
+            self.tree.delete('loading')
+        
+        visible = self.formatted[self.offset:self.offset + self.height]
+        for index, values in enumerate(visible):
+            iid = f"row{index}"
+            if self.tree.exists(iid):
+                self.tree.item(iid, values=values)
+            else:
+                self.tree.insert('', tk.END, iid=iid, values=values)
+        
+        # Drop rows left over from a longer window (end of history)
+        for index in range(len(visible), self.height):
+            iid = f"row{index}"
+            if self.tree.exists(iid):
+                self.tree.delete(iid)
+        
+        # Keep the highlight on the selected record rather than on a row slot
+        selected_iid = None
+        for index, values in enumerate(visible):
+            if values[6] == self.selected_id:
+                selected_iid = f"row{index}"
+                break
+        if selected_iid:
+            self.tree.selection_set(selected_iid)
+        elif self.tree.selection():
+            self.tree.selection_remove(*self.tree.selection())
+        
+        if self.total > 0:
+            first = self.offset / self.total
+            last = min(1.0, (self.offset + self.height) / self.total)
+            self.scrollbar.set(first, last)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+    
+    def scroll_to(self, offset):
+        """Move the window so `offset` is the first visible record"""
+        max_offset = max(0, self.total - self.height)
+        offset = max(0, min(int(offset), max_offset))
+        
+        # Keyset pages arrive in order, so never jump past what is loaded
+        offset = min(offset, max(0, len(self.records) - self.height))
+        if offset != self.offset:
+            self.offset = offset
+            self.render()
+        self.ensure_loaded()
+    
+    def on_scrollbar(self, *args):
+        """Handle scrollbar drags, arrow clicks and trough clicks"""
+        if args[0] == 'moveto':
+            self.scroll_to(float(args[1]) * self.total)
+        elif args[0] == 'scroll':
+            step = int(args[1])
+            if args[2] == 'pages':
+                step *= self.height
+            self.scroll_to(self.offset + step)
+    
+    def on_mousewheel(self, event):
+        """Scroll three rows per wheel notch"""
+        self.scroll_to(self.offset - 3 * (1 if event.delta > 0 else -1))
+        return 'break'
+    
+    def on_select(self, event):
+        """Remember which record is selected"""
+        selected = self.tree.selection()
+        if selected and selected[0] != 'loading':
+            self.selected_id = self.tree.item(selected[0])['values'][6]
+    
+    def on_key_up(self, event):
+        """Scroll up when moving the selection past the top row"""
+        if self.tree.focus() == 'row0' and self.offset > 0:
+            self.scroll_to(self.offset - 1)
+            return 'break'
+    
+    def on_key_down(self, event):
+        """Scroll down when moving the selection past the bottom row"""
+        if self.tree.focus() == f"row{self.height - 1}":
+            self.scroll_to(self.offset + 1)
+            return 'break'
+    
+    def find_record(self, record_id):
+        """Return the cached record with this ID, or None"""
+        for fare in self.records:
+            if fare.get('id') == record_id:
+                return fare
+        return None
+    
+    def remove_record(self, record_id):
+        """Drop one record from the table without refetching the history"""
+        for index, fare in enumerate(self.records):
+            if fare.get('id') == record_id:
+                del self.records[index]
+                del self.formatted[index]
+                self.total = max(0, self.total - 1)
+                break
+        else:
+            return False
+        
+        if self.selected_id == record_id:
+            self.selected_id = None
+        
+        # Pull the window back if it now runs past the end
+        self.offset = max(0, min(self.offset, self.total - self.height))
+        self.render()
+        self.ensure_loaded()
+        return True
+    
+    def selected_record_id(self):
+        """Return the ID of the selected record, or None"""
+        return self.selected_id
@@ -1,22 +1,32 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from fare_calculator import data_entry, load_fare_guide
-from database import save_fare_record
-from session import load_session
+import fare_calculator
+from fare_calculator import data_entry, load_fare_guide, suggest_locations
+from fare_journal import queue_fare_record
+from async_db import run_async
+
+# How often the page checks whether the file watcher loaded new fares
+FARE_VERSION_CHECK_MS = 1000
 
 class TrackPage:
-    def __init__(self, parent, navigate_callback):
+    def __init__(self, parent, navigate_callback, sessions):
         self.parent = parent
         self.navigate_callback = navigate_callback
+        self.sessions = sessions
         self.frame = tk.Frame(parent, bg='#f0f0f0')
         self.current_route_details = None
         self.current_total = 0.0
         
-        # Load fare guide on initialization
-        if not load_fare_guide():
-            messagebox.showwarning("Warning", "Could not load fare data. Please ensure fare_data.csv exists.")
-        
         self.create_widgets()
+        
+        # Usually already loaded by the startup prewarm; otherwise load it without blocking the page
+        if not fare_calculator.fare_guide:
+            run_async(self.frame, load_fare_guide, on_success=self.fare_guide_loaded)
+        
+        # The fare watcher swaps in new guides; tell the user when that happens
+        self.fare_version = fare_calculator.fare_guide_version
+        self.version_check = self.frame.after(FARE_VERSION_CHECK_MS, self.check_fare_version)
+        self.frame.bind('<Destroy>', self.on_destroy)
     
     def create_widgets(self):
         """Create all widgets for the Track page"""
@@ -28,7 +38,17 @@ class TrackPage:
             bg='#f0f0f0',
             fg='#333'
         )
-        title_label.pack(pady=20)
+        title_label.pack(pady=(20, 0))
+        
+        # Shown when updated fares are loaded while the page is open
+        self.notice_label = tk.Label(
+            self.frame,
+            text="",
+            font=('Arial', 10),
+            bg='#f0f0f0',
+            fg='#0066cc'
+        )
+        self.notice_label.pack(pady=(0, 10))
         
         # Main container with two boxes side by side
         main_container = tk.Frame(self.frame, bg='#f0f0f0')
@@ -65,7 +85,7 @@ class TrackPage:
             bg='#ffffff',
             anchor='w'
         ).pack(fill=tk.X, pady=(0, 5))
-        self.start_entry = tk.Entry(entry_frame, font=('Arial', 10))
+        self.start_entry = self.create_location_entry(entry_frame)
         self.start_entry.pack(fill=tk.X, pady=(0, 10))
         
         # Destination input
@@ -76,7 +96,7 @@ class TrackPage:
             bg='#ffffff',
             anchor='w'
         ).pack(fill=tk.X, pady=(0, 5))
-        self.destination_entry = tk.Entry(entry_frame, font=('Arial', 10))
+        self.destination_entry = self.create_location_entry(entry_frame)
         self.destination_entry.pack(fill=tk.X, pady=(0, 10))
         
         # Include trike input
@@ -176,10 +196,34 @@ class TrackPage:
         )
         self.success_label.pack()
     
+    def create_location_entry(self, parent):
+        """Create a location input whose dropdown suggests known locations"""
+        entry = ttk.Combobox(parent, font=('Arial', 10))
+        entry.bind('<KeyRelease>', lambda event: self.update_suggestions(entry))
+        return entry
+    
+    def selected_district(self):
+        """Return the district typed in, or None if it is not a number"""
+        try:
+            return int(self.district_entry.get().strip())
+        except ValueError:
+            return None
+    
+    def fare_guide_loaded(self, loaded):
+        """Warn if the background load of the fare guide failed"""
+        # The first load is not an update; only later reloads get a notice
+        self.fare_version = fare_calculator.fare_guide_version
+        if not loaded:
+            messagebox.showwarning("Warning", "Could not load fare data. Please ensure fare_data.csv exists.")
+    
+    def update_suggestions(self, entry):
+        """Refresh a location dropdown with locations matching what was typed"""
+        entry['values'] = suggest_locations(entry.get(), district=self.selected_district())
+    
     def calculate_fare(self):
         """Calculate fare based on user input"""
-        # Reload fare guide to ensure it's up to date
-        if not load_fare_guide():
+        # The fare watcher keeps the guide current; only load here if nothing is loaded yet
+        if not fare_calculator.fare_guide and not load_fare_guide():
             messagebox.showerror("Error", "Fare data not loaded. Please ensure fare_data.csv exists.")
             return
         
@@ -218,7 +262,7 @@ class TrackPage:
         
         route_text = "Calculated Route:\n\n"
         for detail in route_details:
-            route_text += f"{detail['segment']} ({detail['transport_type']}): ₱{detail['fare']:.2f}\n"
+            route_text += f"{detail.segment} ({detail.transport_type}): ₱{detail.fare:.2f}\n"
         
         self.route_text.insert(1.0, route_text)
         self.route_text.config(state=tk.DISABLED)
@@ -234,7 +278,7 @@ class TrackPage:
     
     def save_record(self):
         """Save fare record to database"""
-        srcode = load_session()
+        srcode = self.sessions.current_srcode()
         if not srcode:
             messagebox.showerror("Error", "Please login first")
             self.navigate_callback("logout")
@@ -247,14 +291,19 @@ class TrackPage:
             messagebox.showerror("Error", "Invalid district value")
             return
         
-        if save_fare_record(
+        # Journaled to disk first, then synced to the database in batches
+        self.finish_save(queue_fare_record(
             srcode,
             district_int,
             self.current_start,
             self.current_destination,
             self.current_trike,
             self.current_total
-        ):
+        ))
+    
+    def finish_save(self, saved):
+        """Update the page once the record is saved"""
+        if saved:
             self.success_label.config(text="Data saved successfully!")
             messagebox.showinfo("Success", "Data saved successfully!")
             
@@ -271,8 +320,30 @@ class TrackPage:
             self.total_label.config(text="Total Fare: ₱0.00")
             self.save_btn.config(state=tk.DISABLED)
         else:
+            self.save_btn.config(state=tk.NORMAL)
             messagebox.showerror("Error", "Failed to save record")
     
+    def check_fare_version(self):
+        """Show a notice if the fare guide was reloaded since the last check"""
+        version = fare_calculator.fare_guide_version
+        if version != self.fare_version:
+            # Version 0 means nothing was loaded yet (e.g. the startup prewarm finished the
+            # first load); that is not an update, so there is nothing to tell the user
+            if self.fare_version != 0:
+                route_count = len(fare_calculator.fare_guide)
+                message = f"Updated fares loaded ({route_count} routes)"
+                if self.save_btn['state'] == tk.NORMAL:
+                    message += " - calculate again to use them"
+                self.notice_label.config(text=message)
+            self.fare_version = version
+        self.version_check = self.frame.after(FARE_VERSION_CHECK_MS, self.check_fare_version)
+    
+    def on_destroy(self, event):
+        """Stop checking for new fares once the page is gone"""
+        if event.widget is self.frame and self.version_check:
+            self.frame.after_cancel(self.version_check)
+            self.version_check = None
+    
     def get_frame(self):
         """Return the frame widget"""
         return self.frame